@@ -0,0 +1,141 @@
+import os
+import io
+import mmap
+import struct
+import hashlib
+import zipfile
+import threading
+
+ARCHIVE_NAME = "pages.cbz"
+# Cabeçalho local de um membro do ZIP (30 bytes fixos antes do nome)
+_LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+
+
+def archive_path(chapter_dir):
+    return os.path.join(chapter_dir, ARCHIVE_NAME)
+
+
+class ChapterArchive:
+    def __init__(self, chapter_dir):
+        self.path = archive_path(chapter_dir)
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def add(self, src_path, arcname):
+        # ZIP_STORED: as imagens já são comprimidas e o conteúdo pode ser lido
+        # direto do arquivo, sem descompressão. Abrir e fechar a cada página
+        # mantém o diretório central sempre gravado, mesmo se o processo cair
+        with self._lock:
+            if self.exists():
+                with zipfile.ZipFile(self.path) as zf:
+                    present = arcname in zf.NameToInfo
+                    if present and _file_digest(src_path) == _member_digest(zf, arcname):
+                        return
+                if present:
+                    # Página baixada de novo com outro conteúdo: a cópia antiga sai do CBZ
+                    self._rewrite_without(arcname)
+            with zipfile.ZipFile(self.path, 'a', compression=zipfile.ZIP_STORED) as zf:
+                zf.write(src_path, arcname)
+
+    def _rewrite_without(self, arcname):
+        tmp_path = self.path + ".tmp"
+        with zipfile.ZipFile(self.path) as src, zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED) as dst:
+            for info in src.infolist():
+                if info.filename != arcname:
+                    dst.writestr(info, src.read(info))
+        os.replace(tmp_path, self.path)
+
+    def names(self):
+        if not self.exists():
+            return []
+        with zipfile.ZipFile(self.path) as zf:
+            return list(dict.fromkeys(zf.namelist()))
+
+    def open(self, name):
+        with zipfile.ZipFile(self.path) as zf:
+            return io.BytesIO(zf.read(name))
+
+
+def _file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _member_digest(zf, name):
+    hasher = hashlib.sha256()
+    with zf.open(name) as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def pack_chapter(manifest, archive):
+    # Move as páginas (e variantes) já processadas para o CBZ do capítulo
+    packed = 0
+    for page, entry in manifest.items():
+        if entry.get('archived') or not entry.get('file'):
+            continue
+        src_path = os.path.join(manifest.pages_dir, entry['file'])
+        if not os.path.exists(src_path):
+            continue
+        files = [entry['file']] + [v['file'] for v in (entry.get('variants') or {}).get('items', [])]
+        for name in files:
+            path = os.path.join(manifest.pages_dir, name)
+            if os.path.exists(path):
+                archive.add(path, name.replace(os.sep, '/'))
+                os.remove(path)
+        manifest.update(page, archived=True)
+        packed += 1
+
+    variants_dir = os.path.join(manifest.pages_dir, "variants")
+    if os.path.isdir(variants_dir) and not os.listdir(variants_dir):
+        os.rmdir(variants_dir)
+    if packed:
+        print(f"[CBZ] {packed} páginas empacotadas em {archive.path}")
+    return packed
+
+
+class ArchiveReader:
+    # Acesso aleatório às páginas via mmap: cada membro é só uma fatia do arquivo
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.entries = {}
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if info.compress_type == zipfile.ZIP_STORED:
+                    self.entries[info.filename] = (self._data_offset(info.header_offset), info.file_size)
+
+    def _data_offset(self, header_offset):
+        fields = _LOCAL_HEADER.unpack_from(self._mmap, header_offset)
+        name_length, extra_length = fields[-2], fields[-1]
+        return header_offset + _LOCAL_HEADER.size + name_length + extra_length
+
+    def get(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        offset, size = entry
+        return memoryview(self._mmap)[offset:offset + size]
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+def open_page(path):
+    # Abre uma página do disco ou, se ela já foi empacotada, de dentro do CBZ
+    if os.path.exists(path):
+        return open(path, 'rb')
+    pages_dir, name = os.path.split(path)
+    archive = ChapterArchive(os.path.dirname(pages_dir))
+    if not archive.exists():
+        raise FileNotFoundError(path)
+    return archive.open(name)
@@ -0,0 +1,280 @@
+import os
+import time
+import asyncio
+import hashlib
+import argparse
+from urllib.parse import urlparse
+
+from fetchers import ChapterPage
+from index import generate_index_html
+from metrics import metrics
+from ratelimit import parse_retry_after
+from retry import RetryPolicy, RETRY_STATUS, TIMEOUT
+from toc import parse_chapter_list, series_url, same_chapter
+from main import (
+    prepare_chapter, finish_chapter, get_next_chapter, setup_session,
+    PageTranscoder, AdaptiveHostLimiter, BlobStore, BLOB_DIR, DEDUP_PAGES, PERCEPTUAL_DEDUP,
+    CHUNK_SIZE, CHAPTER_DISCOVERY
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+# HTTP/2 (várias imagens multiplexadas na mesma conexão) só com o pacote h2
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Downloads de imagem em andamento ao mesmo tempo, somando todos os hosts
+ASYNC_CONCURRENCY = 512
+# Downloads simultâneos por host; com HTTP/2 eles dividem poucas conexões
+ASYNC_PER_HOST = 64
+# Conexões abertas no pool do httpx (as demais requisições esperam a vez)
+ASYNC_CONNECTIONS = 100
+
+
+class AsyncRunner:
+    # Mesmo resultado em disco que o run_pipeline: capítulos são preparados
+    # (título, pasta, URLs das imagens) e finalizados (recompressão, CBZ,
+    # leitor) pelas mesmas funções, em threads; só a rede vira tarefas do loop
+    def __init__(self, output_dir, transcoder=None, blobs=None, concurrency=ASYNC_CONCURRENCY, per_host=ASYNC_PER_HOST):
+        self.output_dir = output_dir
+        self.transcoder = transcoder
+        self.blobs = blobs
+        self.per_host = per_host
+        self.retry = RetryPolicy()
+        self.throttle = AdaptiveHostLimiter()
+        self.image_limiter = AdaptiveHostLimiter(delay=0, min_delay=0)
+        # Sessão síncrona só para as sondagens HEAD do srcset, feitas em threads
+        self.session = setup_session()
+        self.client = httpx.AsyncClient(
+            http2=HTTP2,
+            headers={'User-Agent': 'Mozilla/5.0'},
+            follow_redirects=True,
+            timeout=httpx.Timeout(TIMEOUT[1], connect=TIMEOUT[0], pool=None),
+            limits=httpx.Limits(max_connections=ASYNC_CONNECTIONS, max_keepalive_connections=ASYNC_CONNECTIONS)
+        )
+        self._slots = asyncio.Semaphore(concurrency)
+        self._host_slots = {}
+
+    def host_slot(self, url):
+        host = urlparse(url).netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host)
+        return self._host_slots[host]
+
+    async def close(self):
+        await self.client.aclose()
+        self.session.close()
+
+    async def with_retry(self, func, *args, description="requisição"):
+        for attempt in range(self.retry.attempts):
+            try:
+                return await func(*args)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code not in RETRY_STATUS:
+                    raise
+                error = e
+                retry_after = parse_retry_after(e.response.headers.get('Retry-After'))
+            except httpx.TransportError as e:
+                error = e
+                retry_after = None
+
+            if attempt == self.retry.attempts - 1:
+                raise error
+            delay = self.retry.backoff(attempt, retry_after)
+            print(f"[AVISO] {description} falhou ({error}); tentativa {attempt + 2}/{self.retry.attempts} em {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def fetch_page(self, url):
+        return await self.with_retry(self._fetch_page, url, description=f"Busca de {url}")
+
+    async def _fetch_page(self, url):
+        await asyncio.sleep(max(0, self.throttle.reserve(url)))
+        with metrics.timer('nav_http', url=url) as sample:
+            response = await self.client.get(url)
+            sample['bytes'] = len(response.content)
+        self.throttle.observe(url, response.status_code, parse_retry_after(response.headers.get('Retry-After')))
+        response.raise_for_status()
+        # O parse do HTML é CPU: fica fora do loop
+        return await asyncio.to_thread(ChapterPage, str(response.url), response.text)
+
+    async def discover_chapters(self, page):
+        # Mesmo critério do toc.discover_chapters, com a página da série buscada no loop
+        chapters = parse_chapter_list(page.soup, page.url, links=False)
+        if chapters:
+            return chapters
+        url = series_url(page.url)
+        if url is None or same_chapter(url, page.url):
+            return []
+        try:
+            series = await self.fetch_page(url)
+        except Exception as e:
+            print(f"[AVISO] Não foi possível ler a página da série {url}: {e}")
+            return []
+        return parse_chapter_list(series.soup, page.url)
+
+    async def iter_chapters(self, start_url, first=1):
+        # Equivalente assíncrono do main.iter_chapters
+        page = await self.fetch_page(start_url)
+        chapters = await self.discover_chapters(page) if CHAPTER_DISCOVERY == 'toc' else []
+        start = next((i for i, (_, url) in enumerate(chapters) if same_chapter(url, start_url)), None)
+        if start is not None:
+            print(f"[INFO] Lista de capítulos encontrada: {len(chapters) - start} a partir de {start_url}")
+            yield chapters[start][0], start_url, page
+            for number, url in chapters[start + 1:]:
+                yield number, url, None
+            return
+
+        chapter_num = first
+        while True:
+            yield chapter_num, page.url, page
+            next_url = get_next_chapter(page)
+            if not next_url:
+                print("[FIM] Sem próximos capítulos.")
+                return
+            chapter_num += 1
+            page = await self.fetch_page(next_url)
+
+    async def download_image(self, downloader, url, page):
+        try:
+            async with self._slots, self.host_slot(url):
+                return await self.with_retry(self._download_image, downloader, url, page, description=f"Download de {page}")
+        except Exception as e:
+            print(f"[ERRO] Falha ao baixar {url}: {e}")
+            return None
+
+    async def _download_image(self, downloader, url, page):
+        await asyncio.sleep(max(0, self.image_limiter.reserve(url)))
+        entry = downloader.manifest.get(page)
+        headers = downloader.request_headers(page, url, entry)
+        tmp_path = os.path.join(downloader.pages_dir, page + ".part")
+        labels = {'chapter': downloader.chapter_name, 'page': page}
+        try:
+            start = time.perf_counter()
+            async with self.client.stream('GET', url, headers=headers) as response:
+                metrics.record('latency', time.perf_counter() - start, status=response.status_code, **labels)
+                self.image_limiter.observe(url, response.status_code, parse_retry_after(response.headers.get('Retry-After')))
+                if response.status_code == 304:
+                    return downloader.not_modified(page, entry)
+                response.raise_for_status()
+
+                # Cada bloco é gravado numa thread: o loop segue atendendo as outras conexões
+                hasher = hashlib.sha256()
+                size = 0
+                write_time = 0
+                f = await asyncio.to_thread(open, tmp_path, 'wb')
+                try:
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        hasher.update(chunk)
+                        size += len(chunk)
+                        write_start = time.perf_counter()
+                        await asyncio.to_thread(f.write, chunk)
+                        write_time += time.perf_counter() - write_start
+                finally:
+                    await asyncio.to_thread(f.close)
+                metrics.record('download', time.perf_counter() - start, bytes=size, **labels)
+                metrics.record('write', write_time, bytes=size, **labels)
+            return await asyncio.to_thread(
+                downloader.store_page, page, url, entry, tmp_path, response.headers, size, hasher.hexdigest()
+            )
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    async def run_chapter(self, chapter_num, url, page, previous_ready, ready):
+        try:
+            # Título, pasta e URLs das imagens exatamente como no modo normal
+            _, downloader = await asyncio.to_thread(
+                prepare_chapter, url, chapter_num, self.output_dir, None, self.session, self.throttle,
+                self.image_limiter, self.blobs, page if page is not None else await self.fetch_page(url)
+            )
+        except Exception as e:
+            print(f"[ERRO] Capítulo {chapter_num}: {e}")
+            downloader = None
+        ready.set_result(downloader)
+        if downloader is None:
+            return False
+
+        # Liga ao capítulo anterior para o prefetch do leitor, como o chapter_producer
+        previous = await previous_ready if previous_ready is not None else None
+        if previous is not None:
+            previous.next_chapter_dir = downloader.output_dir
+            downloader.previous = previous
+
+        with metrics.timer('chapter', chapter=downloader.chapter_name):
+            try:
+                pending = downloader.pending_pages()
+                with metrics.timer('chapter_pages', chapter=downloader.chapter_name):
+                    results = await asyncio.gather(*(
+                        self.download_image(downloader, image_url, name) for image_url, name in pending
+                    ))
+                missing = [
+                    {'page': name, 'url': image_url}
+                    for (image_url, name), result in zip(pending, results) if result is None
+                ]
+                success = downloader.finish_pages(missing)
+                if not success:
+                    print(f"[AVISO] Capítulo {chapter_num} incompleto, o leitor será gerado com as páginas disponíveis")
+                await asyncio.to_thread(finish_chapter, chapter_num, downloader, self.transcoder)
+                return success
+            except Exception as e:
+                print(f"[ERRO] Capítulo {chapter_num}: {e}")
+                return False
+
+    async def run_series(self, start_url, num_chapters):
+        # Os capítulos viram tarefas assim que são descobertos; os downloads de
+        # todos eles disputam os mesmos semáforos
+        tasks = []
+        previous_ready = None
+        try:
+            async for chapter_num, url, page in self.iter_chapters(start_url):
+                print(f"\n=== PROCESSANDO CAPÍTULO {chapter_num} ===")
+                ready = asyncio.get_running_loop().create_future()
+                tasks.append(asyncio.create_task(self.run_chapter(chapter_num, url, page, previous_ready, ready)))
+                previous_ready = ready
+                if len(tasks) >= num_chapters:
+                    break
+        except Exception as e:
+            print(f"[ERRO CRÍTICO] {start_url}: {e}")
+        return await asyncio.gather(*tasks)
+
+    async def run(self, start_urls, num_chapters):
+        try:
+            return await asyncio.gather(*(self.run_series(url, num_chapters) for url in start_urls))
+        finally:
+            await self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa capítulos com um único loop asyncio (httpx, HTTP/2 quando disponível)")
+    parser.add_argument("start_urls", nargs="+", help="link do primeiro capítulo de cada série")
+    parser.add_argument("--chapters", type=int, default=1, help="quantidade de capítulos por série")
+    parser.add_argument("--output", default="/home/val/Documentos/Mangas")
+    parser.add_argument("--transcode", help="formato para recomprimir (webp, avif, jpeg)")
+    parser.add_argument("--concurrency", type=int, default=ASYNC_CONCURRENCY)
+    parser.add_argument("--per-host", type=int, default=ASYNC_PER_HOST)
+    args = parser.parse_args()
+
+    if httpx is None:
+        print("[ERRO] O modo assíncrono precisa do httpx: pip install httpx (e h2 para HTTP/2)")
+        return
+    os.makedirs(args.output, exist_ok=True)
+    blobs = BlobStore(os.path.join(args.output, BLOB_DIR), perceptual=PERCEPTUAL_DEDUP) if DEDUP_PAGES else None
+    transcoder = PageTranscoder(args.transcode, blobs=blobs)
+    runner = AsyncRunner(args.output, transcoder, blobs, args.concurrency, args.per_host)
+    try:
+        asyncio.run(runner.run(args.start_urls, args.chapters))
+    finally:
+        transcoder.shutdown()
+    generate_index_html(args.output)
+    metrics.print_summary()
+    print(f"\n✅ Processo concluído{' (HTTP/2)' if HTTP2 else ''}!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import multiprocessing
+from urllib.parse import urlparse
+
+from index import generate_index_html
+from metrics import metrics
+from main import (
+    iter_chapters, prepare_chapter, process_chapter, setup_session, setup_fetcher,
+    PageTranscoder, AdaptiveHostLimiter, BlobStore, HttpCache, BLOB_DIR, CACHE_DIR, DEDUP_PAGES,
+    PERCEPTUAL_DEDUP, HTTP_CACHE
+)
+
+# Arquivo de trabalhos (JSON):
+# {
+#   "output_dir": "/home/val/Documentos/Mangas",
+#   "transcode": "webp",
+#   "jobs": [
+#     {"series": "Nome", "start_url": "https://...", "first": 1, "last": 20}
+#   ]
+# }
+# Com a lista de capítulos da série, "last" é o número real do último capítulo;
+# sem ela, "first" é o número dado ao capítulo do start_url e os seguintes são
+# contados a partir dele. Sem "last", segue até o fim.
+# Cada trabalho pode ter o próprio "output_dir". Aumentar o "last" de uma série
+# já concluída a devolve para a fila na próxima execução.
+
+# Processos de download, cada um com seu navegador e pool HTTP
+BATCH_WORKERS = 2
+# Séries do mesmo site processadas ao mesmo tempo (entre todos os processos)
+MAX_JOBS_PER_HOST = 1
+# Falhas seguidas antes de marcar um trabalho como 'failed'
+MAX_ATTEMPTS = 3
+# Intervalo entre tentativas de pegar trabalho quando os hosts estão ocupados
+POLL_INTERVAL = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    series TEXT NOT NULL,
+    start_url TEXT NOT NULL,
+    host TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    first INTEGER NOT NULL,
+    last INTEGER,
+    next_url TEXT,
+    next_chapter INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL,
+    UNIQUE (series, start_url)
+)
+"""
+
+
+def connect(db_path):
+    # isolation_level=None: as transações são abertas à mão com BEGIN IMMEDIATE,
+    # que trava a escrita e impede dois processos de pegarem o mesmo trabalho
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    return conn
+
+
+def load_jobs(conn, job_file, retry_failed=False):
+    with open(job_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    default_dir = data.get('output_dir')
+
+    conn.execute("BEGIN IMMEDIATE")
+    # Trabalhos que ficaram 'running' numa execução interrompida voltam para a fila
+    conn.execute("UPDATE jobs SET status = 'pending', worker = NULL WHERE status = 'running'")
+    if retry_failed:
+        conn.execute("UPDATE jobs SET status = 'pending', attempts = 0 WHERE status = 'failed'")
+    for job in data['jobs']:
+        output_dir = job.get('output_dir') or default_dir
+        if not output_dir:
+            raise ValueError(f"Trabalho sem output_dir: {job['series']}")
+        first = job.get('first', 1)
+        conn.execute(
+            """INSERT INTO jobs (series, start_url, host, output_dir, first, last, next_url, next_chapter, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (series, start_url) DO UPDATE SET
+                   output_dir = excluded.output_dir,
+                   last = excluded.last,
+                   status = CASE WHEN status = 'done' AND next_url IS NOT NULL
+                                      AND (excluded.last IS NULL OR next_chapter <= excluded.last)
+                                 THEN 'pending' ELSE status END""",
+            (job['series'], job['start_url'], urlparse(job['start_url']).netloc, output_dir,
+             first, job.get('last'), job['start_url'], first, time.time())
+        )
+    conn.execute("COMMIT")
+    return data
+
+
+def claim_job(conn, worker_id, max_per_host=MAX_JOBS_PER_HOST):
+    # Devolve (trabalho, há_pendentes): None com pendentes significa que os
+    # hosts livres já estão no limite e vale esperar
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        job = conn.execute(
+            """SELECT * FROM jobs WHERE status = 'pending' AND host NOT IN (
+                   SELECT host FROM jobs WHERE status = 'running' GROUP BY host HAVING COUNT(*) >= ?
+               ) ORDER BY attempts, id LIMIT 1""",
+            (max_per_host,)
+        ).fetchone()
+        if job is not None:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, updated_at = ? WHERE id = ?",
+                (worker_id, time.time(), job['id'])
+            )
+            pending = True
+        else:
+            pending = conn.execute("SELECT 1 FROM jobs WHERE status = 'pending' LIMIT 1").fetchone() is not None
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return job, pending
+
+
+def update_job(conn, job_id, **fields):
+    fields['updated_at'] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def run_job(conn, job, worker):
+    # Percorre os capítulos da série gravando o ponto de retomada antes de
+    # cada um, para que uma nova execução continue de onde parou
+    previous = None
+    incomplete = []
+    finished = True
+    chapters = iter_chapters(job['next_url'], worker['fetcher'], worker['throttle'], first=job['next_chapter'])
+    for chapter_num, url, page in chapters:
+        update_job(conn, job['id'], next_url=url, next_chapter=chapter_num)
+        if job['last'] is not None and chapter_num > job['last']:
+            finished = False
+            break
+        print(f"\n=== [{job['series']}] PROCESSANDO CAPÍTULO {chapter_num} ===")
+        _, downloader = prepare_chapter(
+            url, chapter_num, job['output_dir'], worker['fetcher'], worker['session'],
+            worker['throttle'], worker['image_limiter'], worker['blobs'], page
+        )
+        if downloader is not None:
+            if previous is not None:
+                previous.next_chapter_dir = downloader.output_dir
+                downloader.previous = previous
+            previous = downloader
+            if not process_chapter(chapter_num, downloader, worker['transcoder']):
+                incomplete.append((chapter_num, url, downloader))
+        update_job(conn, job['id'], attempts=0, error=None)
+
+    # Capítulos com páginas faltando são repetidos uma vez, como no download_worker;
+    # se ainda faltar algo, a retomada volta para o primeiro deles e o trabalho
+    # continua na fila (só as páginas que faltam são baixadas de novo)
+    incomplete = [
+        (chapter_num, url) for chapter_num, url, downloader in incomplete
+        if not retry_chapter(chapter_num, downloader, worker['transcoder'])
+    ]
+    if incomplete:
+        chapter_num, url = incomplete[0]
+        update_job(conn, job['id'], next_url=url, next_chapter=chapter_num)
+        raise RuntimeError(f"capítulos incompletos: {', '.join(str(num) for num, _ in incomplete)}")
+    if finished:
+        # Fim da série: sem next_url, aumentar o "last" não reabre o trabalho
+        update_job(conn, job['id'], next_url=None)
+
+
+def retry_chapter(chapter_num, downloader, transcoder):
+    print(f"[INFO] Repetindo {len(downloader.missing_pages)} páginas do capítulo {chapter_num}")
+    return process_chapter(chapter_num, downloader, transcoder)
+
+
+def batch_worker(db_path, worker_id, max_per_host=MAX_JOBS_PER_HOST, transcode_format=None, cpu_workers=None, cache_dir=None):
+    conn = connect(db_path)
+    throttle = AdaptiveHostLimiter()
+    cache = None
+    if HTTP_CACHE and cache_dir:
+        # Cada processo abre o mesmo cache (o índice SQLite aceita vários processos)
+        cache = HttpCache(cache_dir, offline=HTTP_CACHE == 'offline')
+        if cache.offline:
+            throttle = AdaptiveHostLimiter(delay=0, min_delay=0)
+    session = setup_session(cache=cache)
+    # Um navegador por processo: o paralelismo vem do número de processos
+    worker = {
+        'session': session,
+        'throttle': throttle,
+        'image_limiter': AdaptiveHostLimiter(delay=0, min_delay=0),
+        'fetcher': setup_fetcher(session, pool_size=1, limiter=throttle, cache=cache),
+        'transcoder': PageTranscoder(transcode_format, workers=cpu_workers),
+        'blobs': None
+    }
+    blob_stores = {}
+    try:
+        while True:
+            job, pending = claim_job(conn, worker_id, max_per_host)
+            if job is None:
+                if not pending:
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            if DEDUP_PAGES and job['output_dir'] not in blob_stores:
+                blob_stores[job['output_dir']] = BlobStore(
+                    os.path.join(job['output_dir'], BLOB_DIR), perceptual=PERCEPTUAL_DEDUP
+                )
+            worker['blobs'] = blob_stores.get(job['output_dir'])
+            # Recompressões reaproveitadas entre capítulos da mesma pasta de saída
+            worker['transcoder'].blobs = worker['blobs']
+            os.makedirs(job['output_dir'], exist_ok=True)
+            try:
+                run_job(conn, job, worker)
+                update_job(conn, job['id'], status='done', worker=None)
+                print(f"[SUCESSO] Série concluída: {job['series']}")
+            except Exception as e:
+                attempts = job['attempts'] + 1
+                status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+                update_job(conn, job['id'], status=status, worker=None, attempts=attempts, error=str(e))
+                print(f"[ERRO] {job['series']}: {e} ({status}, tentativa {attempts}/{MAX_ATTEMPTS})")
+    finally:
+        worker['transcoder'].shutdown()
+        worker['fetcher'].close()
+        session.close()
+        if cache is not None:
+            cache.close()
+        conn.close()
+        print(f"\n[INFO] Etapas do worker {worker_id}:")
+        metrics.print_summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa várias séries sem interação, a partir de um arquivo de trabalhos")
+    parser.add_argument("job_file", help="arquivo JSON com os trabalhos")
+    parser.add_argument("--db", help="fila SQLite (padrão: ao lado do arquivo de trabalhos)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--per-host", type=int, default=MAX_JOBS_PER_HOST)
+    parser.add_argument("--retry-failed", action="store_true", help="devolve à fila os trabalhos que falharam")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.splitext(args.job_file)[0] + ".sqlite3"
+    conn = connect(db_path)
+    data = load_jobs(conn, args.job_file, args.retry_failed)
+
+    # Os processos de conversão são divididos entre os workers
+    cpu_workers = max(1, (os.cpu_count() or 1) // args.workers)
+    # Um cache HTTP para todo o lote, na pasta de saída padrão (ou ao lado da fila)
+    cache_dir = os.path.join(data.get('output_dir') or os.path.dirname(os.path.abspath(db_path)), CACHE_DIR)
+    workers = [
+        multiprocessing.Process(
+            target=batch_worker,
+            args=(db_path, worker_id, args.per_host, data.get('transcode'), cpu_workers, cache_dir)
+        )
+        for worker_id in range(1, args.workers + 1)
+    ]
+    for process in workers:
+        process.start()
+    # Se um processo morrer, o trabalho dele volta para a fila e libera o host
+    running = dict(zip(range(1, args.workers + 1), workers))
+    while running:
+        for worker_id, process in list(running.items()):
+            process.join(timeout=1)
+            if process.is_alive():
+                continue
+            del running[worker_id]
+            if process.exitcode != 0:
+                print(f"[AVISO] Worker {worker_id} terminou com código {process.exitcode}")
+                conn.execute(
+                    "UPDATE jobs SET status = 'pending', worker = NULL WHERE status = 'running' AND worker = ?",
+                    (worker_id,)
+                )
+
+    # Um índice por pasta de saída, já com todas as séries
+    for (output_dir,) in conn.execute("SELECT DISTINCT output_dir FROM jobs"):
+        if os.path.isdir(output_dir):
+            generate_index_html(output_dir)
+
+    print("\nResumo:")
+    for job in conn.execute("SELECT series, status, next_url, next_chapter, error FROM jobs ORDER BY id"):
+        line = f"  {job['series']}: {job['status']}"
+        if job['next_url']:
+            line += f" (próximo capítulo {job['next_chapter']})"
+        if job['error']:
+            line += f" - {job['error']}"
+        print(line)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
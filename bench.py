@@ -0,0 +1,115 @@
+import os
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import requests
+from PIL import Image
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from main import MangaImageDownloader, setup_session
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, handshake_delay=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handshake_delay = handshake_delay
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        # Cada conexão aceita equivale a um handshake TCP (e TLS, em produção)
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    image_bytes = b''
+
+    def setup(self):
+        super().setup()
+        # Simula o custo de ida e volta do handshake na primeira requisição da conexão
+        if self.server.handshake_delay:
+            time.sleep(self.server.handshake_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.image_bytes)))
+        self.end_headers()
+        self.wfile.write(self.image_bytes)
+
+
+class NoPoolSession:
+    # Comportamento anterior: um requests.get avulso por página
+    def get(self, url, **kwargs):
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        headers.update(kwargs.pop('headers', {}))
+        return requests.get(url, headers=headers, **kwargs)
+
+    def close(self):
+        pass
+
+
+def make_image(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (120, 60, 30)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def run_chapters(server, session, num_chapters, num_pages, work_dir):
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    server.connections = 0
+    timings = []
+    for chapter in range(1, num_chapters + 1):
+        chapter_dir = os.path.join(work_dir, f"Bench_capitulo_{chapter}")
+        downloader = MangaImageDownloader(base_url, chapter_dir, session=session)
+        downloader.image_urls = [f"{base_url}/{chapter}/{page}.jpg" for page in range(num_pages)]
+        start = time.perf_counter()
+        downloader.download_pages()
+        timings.append(time.perf_counter() - start)
+        shutil.rmtree(chapter_dir)
+    return server.connections, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara downloads com e sem o pool HTTP compartilhado.")
+    parser.add_argument('--chapters', type=int, default=5)
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--width', type=int, default=800)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--handshake-ms', type=float, default=30.0)
+    args = parser.parse_args()
+
+    ImageHandler.image_bytes = make_image(args.width, args.height)
+    server = CountingServer(('127.0.0.1', 0), ImageHandler, handshake_delay=args.handshake_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    work_dir = tempfile.mkdtemp(prefix="manga_bench_")
+
+    try:
+        results = {}
+        for label, session in (("sem sessão", NoPoolSession()), ("com sessão", setup_session())):
+            connections, timings = run_chapters(server, session, args.chapters, args.pages, work_dir)
+            session.close()
+            results[label] = (connections, timings)
+
+        print(f"\n{args.chapters} capítulos x {args.pages} páginas, handshake simulado de {args.handshake_ms:.0f} ms")
+        print(f"{'modo':<12} {'handshakes':>11} {'hs/capítulo':>12} {'s/capítulo':>11}")
+        for label, (connections, timings) in results.items():
+            print(f"{label:<12} {connections:>11} {connections / args.chapters:>12.1f} {sum(timings) / len(timings):>11.3f}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
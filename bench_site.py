@@ -0,0 +1,246 @@
+import os
+import io
+import json
+import time
+import random
+import shutil
+import resource
+import argparse
+import tempfile
+import multiprocessing
+from PIL import Image
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import main
+from index import generate_index_html
+from manifest import ChapterManifest, MANIFEST_NAME
+from metrics import metrics
+from srcset import default_selector
+
+# Imagens distintas geradas para o site falso; as páginas repetem essas
+# imagens com um sufixo diferente, então o conteúdo (e o hash) nunca se repete
+IMAGE_POOL = 16
+# Tamanho dos blocos enviados quando há limite de banda
+BANDWIDTH_CHUNK = 16 * 1024
+
+
+def make_images(width, height, quality, count=IMAGE_POOL):
+    # Ruído comprime mal como uma página de verdade, ao contrário de uma cor lisa
+    images = []
+    for seed in range(count):
+        random.seed(seed)
+        img = Image.effect_noise((width // 4, height // 4), 40 + seed).resize((width, height)).convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=quality)
+        images.append(buffer.getvalue())
+    return images
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        self.head = head
+        options = self.server.options
+        if options['latency']:
+            time.sleep(options['latency'])
+        path, _, query = self.path.partition('?')
+        path = path.strip('/').split('/')
+
+        if path == ['serie'] and options['toc']:
+            return self._send_html(self._series_page())
+        if len(path) == 2 and path[0] == 'serie' and path[1].startswith('capitulo-'):
+            chapter = int(path[1].split('-')[1])
+            if 1 <= chapter <= options['chapters']:
+                return self._send_html(self._chapter_page(chapter))
+        if len(path) == 3 and path[0] == 'img':
+            if self.server.random.random() < options['error_rate']:
+                # Falha transitória: o downloader deve repetir a requisição
+                self.send_response(503)
+                self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            chapter, page = int(path[1]), int(path[2].split('.')[0])
+            # "?w=" pede a variante menor do srcset
+            width = int(query[2:]) if query.startswith('w=') else options['width']
+            images = self.server.images[width]
+            body = images[(chapter * 31 + page) % len(images)] + f"{chapter}-{page}".encode()
+            return self._send(body, 'image/jpeg')
+
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _series_page(self):
+        links = "".join(
+            f'<li><a href="/serie/capitulo-{n}">Capítulo {n}</a></li>'
+            for n in range(self.server.options['chapters'], 0, -1)
+        )
+        return f"<html><head><title>Bench Manga | Site</title></head><body><ul>{links}</ul></body></html>"
+
+    def _chapter_page(self, chapter):
+        options = self.server.options
+        small = options['width'] // 2
+        images = "".join(
+            f'<div class="chapter-image-container"><img src="/img/{chapter}/{page}.jpg?w={small}" '
+            f'srcset="/img/{chapter}/{page}.jpg?w={small} {small}w, /img/{chapter}/{page}.jpg {options["width"]}w"></div>'
+            for page in range(1, options['pages'] + 1)
+        )
+        next_link = ""
+        if chapter < options['chapters']:
+            next_link = f'<a class="next-chapter-btn" href="/serie/capitulo-{chapter + 1}">Próximo</a>'
+        return (f"<html><head><title>Bench Manga Capítulo {chapter} | Site</title></head>"
+                f"<body>{images}{next_link}</body></html>")
+
+    def _send_html(self, html):
+        self._send(html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.head:
+            return
+        bandwidth = self.server.options['bandwidth']
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        # Limite de banda por conexão: blocos espaçados no tempo
+        for offset in range(0, len(body), BANDWIDTH_CHUNK):
+            chunk = body[offset:offset + BANDWIDTH_CHUNK]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / bandwidth)
+
+
+def serve(options, port_queue):
+    # Roda em outro processo para não somar CPU e memória ao downloader medido
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSiteHandler)
+    server.daemon_threads = True
+    server.options = options
+    server.random = random.Random(options['seed'])
+    small = options['width'] // 2
+    server.images = {
+        options['width']: make_images(options['width'], options['height'], options['quality']),
+        small: make_images(small, options['height'] // 2, options['quality'])
+    }
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def run_pipeline(base_url, args, output_dir):
+    session = main.setup_session()
+    throttle = main.AdaptiveHostLimiter(delay=0, min_delay=0)
+    fetcher = main.setup_fetcher(session, mode='http', limiter=throttle)
+    blobs = main.BlobStore(os.path.join(output_dir, main.BLOB_DIR)) if main.DEDUP_PAGES else None
+    transcoder = main.PageTranscoder(args.transcode, blobs=blobs)
+    image_limiter = main.AdaptiveHostLimiter(delay=0, min_delay=0)
+    try:
+        main.run_pipeline([f"{base_url}/serie/capitulo-1"], args.chapters, output_dir, fetcher, session,
+                          transcoder, throttle, image_limiter, blobs)
+        with metrics.timer('index'):
+            generate_index_html(output_dir, force=True)
+    finally:
+        transcoder.shutdown()
+        fetcher.close()
+        session.close()
+
+
+def downloaded_totals(output_dir):
+    pages = size = 0
+    for name in os.listdir(output_dir):
+        chapter_dir = os.path.join(output_dir, name)
+        if not os.path.exists(os.path.join(chapter_dir, MANIFEST_NAME)):
+            continue
+        # Entradas de recorte (tile_of) não têm url: só as páginas baixadas contam
+        for _, entry in ChapterManifest(chapter_dir).items():
+            if entry.get('url'):
+                pages += 1
+                size += entry.get('size') or 0
+    return pages, size
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="Mede o pipeline completo contra um site de mangá falso local.")
+    parser.add_argument('--chapters', type=int, default=5)
+    parser.add_argument('--pages', type=int, default=30)
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--height', type=int, default=1500)
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="atraso antes de cada resposta")
+    parser.add_argument('--bandwidth-kbps', type=float, default=0, help="limite por conexão em KiB/s (0 = sem limite)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fração das imagens respondidas com 503")
+    parser.add_argument('--no-toc', action='store_true', help="sem página da série: segue os links de próximo")
+    parser.add_argument('--variant-policy', default=default_selector.policy, choices=['largest', 'width', 'budget', 'probe'])
+    parser.add_argument('--target-width', type=int, default=default_selector.target_width)
+    parser.add_argument('--transcode', default=None, help="formato para recomprimir (webp, avif, jpeg)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help="mantém a pasta de saída")
+    parser.add_argument('--json', help="grava o resultado neste arquivo JSON")
+    args = parser.parse_args()
+
+    options = {
+        'chapters': args.chapters, 'pages': args.pages, 'width': args.width, 'height': args.height,
+        'quality': args.quality, 'latency': args.latency_ms / 1000, 'bandwidth': args.bandwidth_kbps * 1024,
+        'error_rate': args.error_rate, 'toc': not args.no_toc, 'seed': args.seed
+    }
+    default_selector.policy = args.variant_policy
+    default_selector.target_width = args.target_width
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(options, port_queue), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port_queue.get(timeout=60)}"
+    output_dir = tempfile.mkdtemp(prefix="manga_bench_site_")
+
+    try:
+        start_usage = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        run_pipeline(base_url, args, output_dir)
+        elapsed = time.perf_counter() - start
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # Os processos de recompressão já terminaram (shutdown) e entram em RUSAGE_CHILDREN
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        pages, size = downloaded_totals(output_dir)
+        result = {
+            'chapters': args.chapters,
+            'pages': pages,
+            'expected_pages': args.chapters * args.pages,
+            'megabytes': round(size / 1024 / 1024, 2),
+            'seconds': round(elapsed, 3),
+            'pages_per_second': round(pages / elapsed, 2),
+            'megabytes_per_second': round(size / 1024 / 1024 / elapsed, 2),
+            'cpu_seconds': round(usage.ru_utime + usage.ru_stime - start_usage.ru_utime - start_usage.ru_stime, 3),
+            'children_cpu_seconds': round(children.ru_utime + children.ru_stime, 3),
+            # ru_maxrss vem em KiB no Linux
+            'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+            'children_peak_rss_mb': round(children.ru_maxrss / 1024, 1)
+        }
+
+        metrics.print_summary()
+        print(f"\n{args.chapters} capítulos x {args.pages} páginas de {args.width}x{args.height}, "
+              f"latência {args.latency_ms:.0f} ms, erro {args.error_rate:.0%}")
+        for key, value in result.items():
+            print(f"  {key:<22} {value}")
+        if result['pages'] < result['expected_pages']:
+            print(f"[AVISO] {result['expected_pages'] - result['pages']} páginas não foram baixadas")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+    finally:
+        server.terminate()
+        if args.keep:
+            print(f"[INFO] Saída mantida em {output_dir}")
+        else:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,161 @@
+import os
+import threading
+from PIL import Image
+
+BLOB_DIR = ".blobs"
+PHASH_INDEX = "phash.txt"
+# Distância de Hamming máxima (em 64 bits) para considerar duas imagens iguais
+PHASH_DISTANCE = 3
+# O dHash ignora o brilho absoluto (páginas lisas de cores diferentes têm o
+# mesmo hash), então o brilho médio também precisa ser parecido
+PHASH_BRIGHTNESS = 8
+
+
+def dhash(path, size=8):
+    # Hash de diferença: compara o brilho de pixels vizinhos numa miniatura
+    # em tons de cinza, então recompressões e pequenos ruídos não o alteram.
+    # Devolve também o brilho médio da miniatura
+    with Image.open(path) as img:
+        img.draft('L', (size * 8, size * 8))
+        pixels = img.convert('L').resize((size + 1, size), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            offset = row * (size + 1) + col
+            value = value << 1 | (pixels[offset] > pixels[offset + 1])
+    return value, sum(pixels) // len(pixels)
+
+
+class BlobStore:
+    # Arquivos guardados uma vez por conteúdo (chave = hash + extensão);
+    # as páginas dos capítulos são links para eles
+    def __init__(self, root, perceptual=False, max_distance=PHASH_DISTANCE):
+        self.root = root
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.link_mode = self._probe_link_mode()
+        if self.link_mode is None:
+            print(f"[AVISO] O sistema de arquivos de {root} não aceita links, deduplicação desativada")
+        self._phashes = self._load_phashes() if perceptual else []
+
+    def _probe_link_mode(self):
+        probe = os.path.join(self.root, f".probe.{os.getpid()}")
+        open(probe, 'wb').close()
+        try:
+            for mode, link in (('hard', os.link), ('symbolic', os.symlink)):
+                try:
+                    link(probe, probe + ".link")
+                    os.remove(probe + ".link")
+                    return mode
+                except OSError:
+                    continue
+            return None
+        finally:
+            os.remove(probe)
+
+    def _load_phashes(self):
+        phashes = []
+        try:
+            with open(os.path.join(self.root, PHASH_INDEX), 'r', encoding='utf-8') as f:
+                for line in f:
+                    value, brightness, width, height, key = line.split()
+                    phashes.append((int(value, 16), int(brightness), int(width), int(height), key))
+        except FileNotFoundError:
+            pass
+        return phashes
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def has(self, key):
+        return self.link_mode is not None and os.path.exists(self.path(key))
+
+    def link(self, key, dst_path):
+        # Troca dst_path por um link para o blob, sem janela em que ele não exista
+        blob_path = self.path(key)
+        tmp_path = dst_path + ".link"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        if self.link_mode == 'hard':
+            os.link(blob_path, tmp_path)
+        else:
+            os.symlink(os.path.relpath(blob_path, os.path.dirname(dst_path)), tmp_path)
+        os.replace(tmp_path, dst_path)
+
+    def add(self, src_path, key):
+        # Guarda src_path sob a chave (ou reaproveita o blob existente) e
+        # devolve a chave efetivamente usada pela página
+        if self.link_mode is None:
+            return None
+        with self._lock:
+            if self.perceptual and not os.path.exists(self.path(key)):
+                key = self._find_similar(src_path, key)
+            blob_path = self.path(key)
+            if os.path.exists(blob_path):
+                self.link(key, src_path)
+                return key
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if self.link_mode == 'hard':
+                try:
+                    os.link(src_path, blob_path)
+                except FileExistsError:
+                    self.link(key, src_path)
+            else:
+                os.replace(src_path, blob_path)
+                self.link(key, src_path)
+            return key
+
+    def collect(self, keys):
+        # Apaga os blobs que só existem na própria pasta de blobs (nenhuma página
+        # aponta mais para eles: foram recomprimidas ou foram para o CBZ). Com
+        # links simbólicos não há contagem de referências e nada é apagado
+        if self.link_mode != 'hard':
+            return 0
+        removed = set()
+        with self._lock:
+            for key in set(filter(None, keys)):
+                blob_path = self.path(key)
+                try:
+                    if os.stat(blob_path).st_nlink == 1:
+                        os.remove(blob_path)
+                        removed.add(key)
+                except FileNotFoundError:
+                    pass
+            # Um hash perceptual de um blob apagado faria o add() recriar a chave
+            # antiga com o conteúdo de outra imagem
+            if removed and any(entry[4] in removed for entry in self._phashes):
+                self._phashes = [entry for entry in self._phashes if entry[4] not in removed]
+                self._save_phashes()
+        return len(removed)
+
+    def _save_phashes(self):
+        index_path = os.path.join(self.root, PHASH_INDEX)
+        with open(index_path + ".tmp", 'w', encoding='utf-8') as f:
+            for value, brightness, width, height, key in self._phashes:
+                f.write(f"{value:016x} {brightness} {width} {height} {key}\n")
+        os.replace(index_path + ".tmp", index_path)
+
+    def _find_similar(self, src_path, key):
+        try:
+            with Image.open(src_path) as img:
+                width, height = img.size
+            value, brightness = dhash(src_path)
+        except Exception:
+            return key
+        extension = os.path.splitext(key)[1]
+        for other, other_brightness, other_width, other_height, other_key in self._phashes:
+            # Só imagens do mesmo tamanho e formato: evita trocar páginas diferentes
+            # com o mesmo desenho geral e ligar um .jpg a um blob .png. Blobs
+            # apagados por outro processo também ficam de fora
+            if ((other_width, other_height) == (width, height)
+                    and os.path.splitext(other_key)[1] == extension
+                    and abs(other_brightness - brightness) <= PHASH_BRIGHTNESS
+                    and bin(other ^ value).count("1") <= self.max_distance
+                    and os.path.exists(self.path(other_key))):
+                return other_key
+        self._phashes.append((value, brightness, width, height, key))
+        with open(os.path.join(self.root, PHASH_INDEX), 'a', encoding='utf-8') as f:
+            f.write(f"{value:016x} {brightness} {width} {height} {key}\n")
+        return key
@@ -0,0 +1,96 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+from selenium.common.exceptions import WebDriverException
+
+DRIVER_POOL_SIZE = 2
+# Páginas renderizadas antes de reiniciar o Chrome (limita o crescimento de memória)
+RECYCLE_AFTER = 50
+
+
+class DriverPool:
+    def __init__(self, driver_factory, size=DRIVER_POOL_SIZE, recycle_after=RECYCLE_AFTER):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.recycle_after = recycle_after
+        self._idle = deque()
+        self._uses = {}
+        self._created = 0
+        # Avisa quem espera tanto quando um navegador volta quanto quando uma
+        # vaga é liberada (navegador reciclado ou descartado)
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        while True:
+            driver = self._take_or_create()
+            if self._is_healthy(driver):
+                return driver
+            print("[AVISO] Navegador sem resposta, substituindo")
+            self._discard(driver)
+
+    def release(self, driver):
+        with self._condition:
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+            recycle = self._uses[id(driver)] >= self.recycle_after
+            if not recycle:
+                self._idle.append(driver)
+                self._condition.notify()
+        if recycle:
+            self._discard(driver)
+
+    @contextmanager
+    def driver(self):
+        driver = self.acquire()
+        healthy = True
+        try:
+            yield driver
+        except WebDriverException:
+            # Um navegador que falhou não volta para o pool
+            healthy = False
+            raise
+        finally:
+            if healthy:
+                self.release(driver)
+            else:
+                self._discard(driver)
+
+    def close(self):
+        with self._condition:
+            drivers = list(self._idle)
+            self._idle.clear()
+        for driver in drivers:
+            self._discard(driver)
+
+    def _take_or_create(self):
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                self._condition.wait()
+            if self._idle:
+                return self._idle.popleft()
+            self._created += 1
+        try:
+            print("[INFO] Iniciando navegador headless")
+            return self.driver_factory()
+        except Exception:
+            self._free_slot()
+            raise
+
+    def _is_healthy(self, driver):
+        try:
+            return driver.execute_script("return 1") == 1
+        except WebDriverException:
+            return False
+
+    def _free_slot(self):
+        with self._condition:
+            self._created -= 1
+            self._condition.notify()
+
+    def _discard(self, driver):
+        with self._condition:
+            self._uses.pop(id(driver), None)
+        self._free_slot()
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
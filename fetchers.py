@@ -0,0 +1,166 @@
+import requests
+from bs4 import BeautifulSoup
+from ratelimit import parse_retry_after
+from retry import RetryPolicy, TIMEOUT
+from metrics import metrics
+from selenium.common.exceptions import WebDriverException, TimeoutException
+
+IMAGE_SELECTOR = "div.chapter-image-container img"
+# Tempo máximo de espera pela página e tempo sem mutações para considerá-la pronta
+READY_TIMEOUT = 20
+READY_SETTLE = 0.5
+
+READY_SCRIPT = """
+const [selector, settleMs, timeoutMs, done] = arguments;
+let timer = null;
+let finished = false;
+const count = () => document.querySelectorAll(selector).length;
+const finish = () => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    done(count());
+};
+const arm = () => {
+    clearTimeout(timer);
+    if (count() > 0 && document.readyState !== 'loading') {
+        timer = setTimeout(finish, settleMs);
+    }
+};
+const observer = new MutationObserver(arm);
+observer.observe(document.documentElement, {
+    childList: true, subtree: true, attributes: true,
+    attributeFilter: ['src', 'srcset', 'data-src', 'data-srcset']
+});
+document.addEventListener('readystatechange', arm);
+arm();
+setTimeout(finish, timeoutMs);
+"""
+
+# lxml é bem mais rápido; o parser embutido fica como alternativa
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+
+class ChapterPage:
+    def __init__(self, url, html):
+        self.url = url
+        self.html = html
+        self.soup = BeautifulSoup(html, HTML_PARSER)
+
+    @property
+    def title(self):
+        return self.soup.title.get_text() if self.soup.title else ""
+
+    def has_images(self):
+        return self.soup.select_one(IMAGE_SELECTOR) is not None
+
+
+class HttpPageFetcher:
+    def __init__(self, session, limiter=None, retry=None):
+        self.session = session
+        self.limiter = limiter
+        self.retry = retry if retry is not None else RetryPolicy()
+
+    def fetch(self, url):
+        return self.retry.call(self._fetch, url, description=f"Busca de {url}")
+
+    def _fetch(self, url):
+        with metrics.timer('nav_http', url=url) as sample:
+            response = self.session.get(url, timeout=TIMEOUT)
+            sample['bytes'] = len(response.content)
+        if self.limiter is not None:
+            self.limiter.observe(url, response.status_code, parse_retry_after(response.headers.get('Retry-After')))
+        response.raise_for_status()
+        return ChapterPage(response.url, response.text)
+
+    def close(self):
+        pass
+
+
+class SeleniumPageFetcher:
+    def __init__(self, pool, session=None, cache=None):
+        # Os navegadores só são iniciados quando alguma página precisar deles
+        self.pool = pool
+        self.session = session
+        self.cache = cache
+
+    def fetch(self, url):
+        # O HTML renderizado vai para o cache HTTP: no modo offline ele substitui o navegador
+        if self.cache is not None:
+            cached = self.cache.rendered(url)
+            if cached is not None:
+                return ChapterPage(*cached)
+        page = self._render(url)
+        if self.cache is not None:
+            self.cache.store_rendered(url, page.url, page.html)
+        return page
+
+    def _render(self, url):
+        with self.pool.driver() as driver:
+            # Renderização separada da espera pelas imagens (lazy-load/scripts)
+            with metrics.timer('nav_selenium', url=url):
+                driver.get(url)
+            with metrics.timer('render_wait', url=url):
+                ready = wait_for_images(driver)
+            if not ready:
+                print("[AVISO] Tempo esgotado esperando as imagens do capítulo")
+            if self.session is not None:
+                sync_session_from_driver(self.session, driver)
+            return ChapterPage(driver.current_url, driver.page_source)
+
+    def close(self):
+        self.pool.close()
+
+
+class AutoPageFetcher:
+    def __init__(self, http_fetcher, selenium_fetcher):
+        self.http_fetcher = http_fetcher
+        self.selenium_fetcher = selenium_fetcher
+
+    def fetch(self, url):
+        try:
+            page = self.http_fetcher.fetch(url)
+            if page.has_images():
+                return page
+            print("[INFO] HTML estático sem imagens, renderizando com o navegador")
+        except requests.RequestException as e:
+            print(f"[AVISO] Falha na busca HTTP ({e}), renderizando com o navegador")
+        return self.selenium_fetcher.fetch(url)
+
+    def close(self):
+        self.http_fetcher.close()
+        self.selenium_fetcher.close()
+
+
+def wait_for_images(driver, timeout=READY_TIMEOUT, settle=READY_SETTLE):
+    # Observa mutações do DOM e considera a página pronta quando há imagens
+    # e nada mudou por `settle` segundos, em vez de esperar um tempo fixo
+    driver.set_script_timeout(timeout + 5)
+    try:
+        count = driver.execute_async_script(READY_SCRIPT, IMAGE_SELECTOR, settle * 1000, timeout * 1000)
+    except (TimeoutException, WebDriverException) as e:
+        print(f"[AVISO] Falha ao observar o carregamento da página: {e}")
+        return False
+    return bool(count)
+
+
+def sync_session_from_driver(session, driver):
+    # Copia user-agent e cookies do navegador para que a CDN aceite as requisições
+    try:
+        user_agent = driver.execute_script("return navigator.userAgent")
+        if user_agent:
+            session.headers['User-Agent'] = user_agent
+    except WebDriverException:
+        pass
+    for cookie in driver.get_cookies():
+        session.cookies.set(
+            cookie['name'],
+            cookie['value'],
+            domain=cookie.get('domain'),
+            path=cookie.get('path', '/')
+        )
@@ -0,0 +1,41 @@
+import os
+import threading
+import textwrap
+from contextlib import contextmanager
+
+_written_stylesheets = set()
+_stylesheets_lock = threading.Lock()
+
+
+@contextmanager
+def atomic_writer(path, encoding='utf-8'):
+    # Escreve num temporário na mesma pasta e renomeia no final: quem abre o
+    # arquivo vê a versão antiga inteira ou a nova inteira, nunca metade
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_stylesheet(path, css):
+    # Folha de estilo compartilhada: gravada uma vez por execução e só
+    # reescrita se o conteúdo em disco for diferente
+    path = os.path.abspath(path)
+    with _stylesheets_lock:
+        if path in _written_stylesheets:
+            return
+        css = textwrap.dedent(css).strip() + "\n"
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                current = f.read()
+        except FileNotFoundError:
+            current = None
+        if current != css:
+            with atomic_writer(path) as f:
+                f.write(css)
+        _written_stylesheets.add(path)
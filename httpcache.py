@@ -0,0 +1,399 @@
+import os
+import io
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from metrics import metrics
+
+CACHE_DIR = ".http_cache"
+# Tamanho máximo dos corpos guardados; acima disso saem os menos usados (LRU)
+CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Ao limpar, desce até esta fração do máximo para não limpar a cada resposta
+CACHE_EVICT_TO = 0.9
+# Sem Cache-Control/Expires, uma resposta com Last-Modified vale 10% da sua
+# idade (até um dia); sem nada disso ela fica guardada, mas é revalidada
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX = 24 * 3600
+# Validade do HTML renderizado pelo navegador (não tem cabeçalhos de cache)
+RENDERED_MAX_AGE = 24 * 3600
+# Cabeçalhos que descrevem o corpo original e não valem para a cópia guardada
+DROPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length', 'connection', 'keep-alive')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    vary TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+class CacheMiss(requests.RequestException):
+    # Não é ConnectionError de propósito: no modo offline não adianta repetir
+    pass
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers, now=None):
+    # Segundos em que a resposta pode ser usada sem consultar o servidor;
+    # None quando ela nem pode ser guardada
+    now = now if now is not None else time.time()
+    directives = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-store' in directives or headers.get('Vary', '').strip() == '*':
+        return None
+    if 'no-cache' in directives:
+        return 0
+    try:
+        age = int(headers.get('Age') or 0)
+    except ValueError:
+        age = 0
+    if directives.get('max-age'):
+        try:
+            return max(0, int(directives['max-age']) - age)
+        except ValueError:
+            return 0
+    date = _http_date(headers.get('Date')) or now
+    expires = _http_date(headers.get('Expires'))
+    if expires is not None:
+        return max(0, expires - date)
+    last_modified = _http_date(headers.get('Last-Modified'))
+    if last_modified is not None:
+        return min(HEURISTIC_MAX, max(0, (date - last_modified) * HEURISTIC_FRACTION))
+    return 0
+
+
+class HttpCache:
+    # Respostas GET guardadas em disco: índice SQLite (chave, cabeçalhos, validade,
+    # último uso) e corpos em arquivos, como no blobstore
+    def __init__(self, root, max_bytes=CACHE_MAX_BYTES, offline=False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite3"), timeout=30,
+                                     isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(SCHEMA)
+        self.total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def body_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def lookup(self, url, request_headers=None):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM responses WHERE key = ?", (self.key(url),)).fetchone()
+        if row is None or not os.path.exists(self.body_path(row['key'])):
+            return None
+        entry = dict(row)
+        entry['headers'] = CaseInsensitiveDict(json.loads(row['headers']))
+        entry['vary'] = json.loads(row['vary'])
+        # A chave é a URL; os cabeçalhos listados no Vary precisam bater. No modo
+        # offline qualquer cópia serve (o user-agent do navegador, por exemplo, muda)
+        if not self.offline and request_headers is not None:
+            for name, value in entry['vary'].items():
+                if request_headers.get(name) != value:
+                    return None
+        return entry
+
+    def is_fresh(self, entry):
+        return self.offline or entry['expires_at'] > time.time()
+
+    def touch(self, entry):
+        with self._lock:
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), entry['key']))
+
+    def refresh(self, entry, headers):
+        # 304 do servidor: a cópia continua valendo, com os cabeçalhos novos
+        merged = CaseInsensitiveDict(entry['headers'])
+        merged.update({name: value for name, value in headers.items() if name.lower() not in DROPPED_HEADERS})
+        lifetime = freshness_lifetime(merged) or 0
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET headers = ?, expires_at = ?, last_used = ? WHERE key = ?",
+                (json.dumps(dict(merged)), now + lifetime, now, entry['key'])
+            )
+        entry['headers'] = merged
+        return entry
+
+    def writer(self, url, status, headers, vary, lifetime):
+        return CacheWriter(self, url, status, headers, vary, lifetime)
+
+    def store(self, url, status, headers, vary, lifetime, tmp_path, size):
+        key = self.key(url)
+        path = self.body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        now = time.time()
+        headers = {name: value for name, value in headers.items() if name.lower() not in DROPPED_HEADERS}
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(headers), json.dumps(vary), size, now, now + lifetime, now)
+            )
+            # O mesmo cache pode estar aberto em vários processos (batch):
+            # o total vem sempre do índice, não só do que este processo gravou
+            self.total = self._size()
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def _size(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def store_bytes(self, url, headers, body, lifetime):
+        writer = self.writer(url, 200, headers, {}, lifetime)
+        writer.write(body)
+        writer.finish()
+
+    def evict(self):
+        # Remove os corpos usados há mais tempo até voltar abaixo do limite
+        target = self.max_bytes * CACHE_EVICT_TO
+        removed = []
+        with self._lock:
+            # A transação segura outros processos enquanto a soma e as remoções
+            # são feitas, para que dois deles não limpem o mesmo excesso
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.total = self._size()
+                rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+                for row in rows:
+                    if self.total <= target:
+                        break
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (row['key'],))
+                    try:
+                        os.remove(self.body_path(row['key']))
+                    except FileNotFoundError:
+                        pass
+                    self.total -= row['size']
+                    removed.append(row['key'])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if removed:
+            print(f"[INFO] Cache HTTP: {len(removed)} respostas antigas removidas ({self.total / 1024 / 1024:.0f} MB)")
+
+    def rendered(self, url):
+        # HTML já renderizado pelo navegador; devolve (url final, html) ou None
+        entry = self.lookup("rendered:" + url)
+        if entry is None or not self.is_fresh(entry):
+            if self.offline:
+                raise CacheMiss(f"{url} não está no cache (modo offline)")
+            return None
+        self.touch(entry)
+        metrics.record('cache_hit', 0, kind='rendered')
+        with open(self.body_path(entry['key']), 'r', encoding='utf-8') as f:
+            return entry['headers'].get('X-Final-URL', url), f.read()
+
+    def store_rendered(self, url, final_url, html):
+        headers = {'Content-Type': 'text/html; charset=utf-8', 'X-Final-URL': final_url}
+        self.store_bytes("rendered:" + url, headers, html.encode('utf-8'), RENDERED_MAX_AGE)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CacheWriter:
+    # Recebe o corpo em blocos; só vira entrada do cache se chegar ao fim
+    def __init__(self, cache, url, status, headers, vary, lifetime):
+        self.cache = cache
+        self.args = (url, status, dict(headers), vary, lifetime)
+        self.tmp_path = f"{cache.body_path(cache.key(url))}.{threading.get_ident()}.part"
+        os.makedirs(os.path.dirname(self.tmp_path), exist_ok=True)
+        self.file = open(self.tmp_path, 'wb')
+        self.size = 0
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def finish(self):
+        self.file.close()
+        self.cache.store(*self.args, self.tmp_path, self.size)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class TeeBody:
+    # Fica no lugar do response.raw: repassa o corpo ao requests enquanto grava a cópia
+    def __init__(self, raw, writer):
+        self.raw = raw
+        self.writer = writer
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        for chunk in self.raw.stream(amt, decode_content=True):
+            self._write(chunk)
+            yield chunk
+        self._finish()
+
+    def read(self, amt=None, decode_content=None, **kwargs):
+        data = self.raw.read(amt, decode_content=True)
+        self._write(data)
+        if amt is None or not data:
+            self._finish()
+        return data
+
+    def _write(self, chunk):
+        if self.writer is not None and chunk:
+            try:
+                self.writer.write(chunk)
+            except OSError as e:
+                print(f"[AVISO] Cache HTTP: falha ao gravar ({e})")
+                self.writer.discard()
+                self.writer = None
+
+    def _finish(self):
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            try:
+                writer.finish()
+            except OSError as e:
+                print(f"[AVISO] Cache HTTP: falha ao gravar ({e})")
+                writer.discard()
+
+    def close(self):
+        # Corpo abandonado no meio: a cópia incompleta é descartada
+        if self.writer is not None:
+            self.writer.discard()
+            self.writer = None
+        self.raw.close()
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class CachedBody(io.RawIOBase):
+    # Corpo lido do disco; fecha o arquivo ao chegar ao fim
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+
+    def readable(self):
+        return True
+
+    def read(self, amt=-1, **kwargs):
+        if self.file.closed:
+            return b''
+        data = self.file.read(-1 if amt is None else amt)
+        if not data:
+            self.file.close()
+        return data
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class CachingAdapter(HTTPAdapter):
+    # HTTPAdapter que consulta o HttpCache antes da rede. Vale para tudo que
+    # passa pela sessão: páginas do HttpPageFetcher e downloads de imagens
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if request.method not in ('GET', 'HEAD'):
+            return super().send(request, stream, timeout, verify, cert, proxies)
+
+        entry = self.cache.lookup(request.url, request.headers)
+        no_cache = 'no-cache' in parse_cache_control(request.headers.get('Cache-Control'))
+        if entry is not None and self.cache.is_fresh(entry) and not (no_cache and not self.cache.offline):
+            return self._from_cache(request, entry)
+        if self.cache.offline:
+            raise CacheMiss(f"{request.url} não está no cache (modo offline)", request=request)
+        if request.method == 'HEAD':
+            return super().send(request, stream, timeout, verify, cert, proxies)
+
+        # Cópia vencida: revalida com os validadores dela, a menos que quem pediu
+        # já tenha mandado os próprios (o downloader usa os do manifesto)
+        own_conditions = 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+        if entry is not None and not own_conditions:
+            if entry['headers'].get('ETag'):
+                request.headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                request.headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+        response = super().send(request, stream, timeout, verify, cert, proxies)
+        if response.status_code == 304 and entry is not None:
+            entry = self.cache.refresh(entry, response.headers)
+            if not own_conditions:
+                response.close()
+                # Os validadores eram nossos: quem pediu recebe a cópia inteira, não um 304
+                request.headers.pop('If-None-Match', None)
+                request.headers.pop('If-Modified-Since', None)
+                return self._from_cache(request, entry)
+            return response
+
+        if response.status_code == 200:
+            lifetime = freshness_lifetime(response.headers)
+            if lifetime is not None and 'no-store' not in parse_cache_control(request.headers.get('Cache-Control')):
+                vary = {
+                    name.strip(): request.headers.get(name.strip())
+                    for name in response.headers.get('Vary', '').split(',') if name.strip()
+                }
+                writer = self.cache.writer(request.url, 200, response.headers, vary, lifetime)
+                response.raw = TeeBody(response.raw, writer)
+                metrics.record('cache_miss', 0)
+        return response
+
+    def _from_cache(self, request, entry):
+        self.cache.touch(entry)
+        metrics.record('cache_hit', 0)
+        headers = CaseInsensitiveDict(entry['headers'])
+        headers['X-Cache'] = 'HIT'
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.connection = self
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        response.elapsed = timedelta(0)
+
+        etag = entry['headers'].get('ETag')
+        if etag and request.headers.get('If-None-Match') == etag:
+            # Quem pediu já tem esta versão (revalidação do downloader)
+            response.status_code, response.reason = 304, 'Not Modified'
+            response.raw = io.BytesIO(b'')
+        else:
+            response.status_code, response.reason = entry['status'], 'OK'
+            response.raw = io.BytesIO(b'') if request.method == 'HEAD' else CachedBody(self.cache.body_path(entry['key']))
+            headers['Content-Length'] = str(entry['size'])
+        return response
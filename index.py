@@ -1,50 +1,24 @@
 import os
+import re
+import json
+from archive import ChapterArchive, archive_path
+from thumbnails import generate_thumbnails, THUMB_DIR
+from html_writer import atomic_writer, write_stylesheet
 
-def generate_index_html(base_dir):
-    index_path = os.path.join(base_dir, "index.html")
-    chapters = []
-    
-    for item in os.listdir(base_dir):
-        item_path = os.path.join(base_dir, item)
-        if os.path.isdir(item_path) and "_capitulo_" in item:
-            if os.path.exists(os.path.join(item_path, "leitor.html")):
-                chapter_name = item.replace("_", " ").replace("capitulo", "Capítulo")
-                
-                # Caminho relativo da capa
-                cover_rel = os.path.join(item, "pages", "page_02.png")
-                cover_abs = os.path.join(base_dir, cover_rel)
-
-                if not os.path.exists(cover_abs):
-                    pages = sorted([f for f in os.listdir(os.path.join(item_path, "pages")) 
-                                  if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-                    if len(pages) >= 2:
-                        cover_rel = os.path.join(item, "pages", pages[1])
-                    elif pages:
-                        cover_rel = os.path.join(item, "pages", pages[0])
-                    else:
-                        cover_rel = None
-
-                chapters.append({
-                    'path': item,
-                    'name': chapter_name,
-                    'cover': cover_rel if cover_rel and os.path.exists(os.path.join(base_dir, cover_rel)) else None,
-                    'leitor': os.path.join(item, "leitor.html")
-                })
-    
-    if not chapters:
-        print("Nenhum capítulo válido encontrado para gerar o índice.")
-        return False
-    
-    chapters.sort(key=lambda x: int(''.join(filter(str.isdigit, x['path']))))
-    
-    html_content = f"""<!DOCTYPE html>
-<html lang="pt-BR">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Biblioteca de Mangás</title>
-    <style>
-        :root {{
+# Catálogo persistido ao lado do index.html com o estado de cada capítulo
+CATALOG_NAME = ".catalog.json"
+# Chaves do catálogo que não vêm do scan_chapter (estado do disco e miniaturas)
+CATALOG_STATE_KEYS = ('mtime', 'pages_mtime', 'archive_mtime', 'thumb', 'thumb_width', 'thumb_height', 'thumb_failed')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.avif', '.jxl')
+# 'static' gera todos os cards no HTML; 'app' gera catalog.js e uma página que
+# renderiza os cards aos poucos; 'auto' escolhe 'app' acima de LARGE_LIBRARY capítulos
+INDEX_MODE = 'auto'
+LARGE_LIBRARY = 500
+APP_PAGE_SIZE = 60
+
+INDEX_STYLESHEET = "index.css"
+INDEX_STYLE = """
+        :root {
             --bg-color: #f8f8f8;
             --card-bg: #ffffff;
             --text-color: #333333;
@@ -52,54 +26,54 @@ def generate_index_html(base_dir):
             --accent-color: #4a6fa5;
             --border-color: #e0e0e0;
             --shadow: 0 4px 12px rgba(0, 0, 0, 0.08);
-        }}
+        }
         
-        * {{
+        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
         
-        body {{
+        body {
             background-color: var(--bg-color);
             color: var(--text-color);
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
             line-height: 1.6;
             padding: 20px;
-        }}
+        }
         
-        .header {{
+        .header {
             text-align: center;
             margin-bottom: 30px;
             padding-bottom: 20px;
             border-bottom: 1px solid var(--border-color);
-        }}
+        }
         
-        .title {{
+        .title {
             font-size: 28px;
             font-weight: 600;
             color: var(--text-color);
             margin-bottom: 5px;
-        }}
+        }
         
-        .subtitle {{
+        .subtitle {
             font-size: 14px;
             color: var(--secondary-text);
-        }}
+        }
         
-        .library-container {{
+        .library-container {
             max-width: 1200px;
             margin: 0 auto;
-        }}
+        }
         
-        .chapters-grid {{
+        .chapters-grid {
             display: grid;
             grid-template-columns: repeat(auto-fill, minmax(180px, 1fr));
             gap: 20px;
             padding: 10px;
-        }}
+        }
         
-        .chapter-card {{
+        .chapter-card {
             background: var(--card-bg);
             border-radius: 8px;
             overflow: hidden;
@@ -107,46 +81,46 @@ def generate_index_html(base_dir):
             transition: transform 0.2s, box-shadow 0.2s;
             text-decoration: none;
             color: inherit;
-        }}
+        }
         
-        .chapter-card:hover {{
+        .chapter-card:hover {
             transform: translateY(-4px);
             box-shadow: 0 8px 16px rgba(0, 0, 0, 0.12);
-        }}
+        }
         
-        .cover-container {{
+        .cover-container {
             position: relative;
             width: 100%;
             height: 250px;
             overflow: hidden;
             background-color: #f0f0f0;
-        }}
+        }
         
-        .chapter-cover {{
+        .chapter-cover {
             width: 100%;
             height: 100%;
             object-fit: cover;
             transition: transform 0.3s;
-        }}
+        }
         
-        .chapter-card:hover .chapter-cover {{
+        .chapter-card:hover .chapter-cover {
             transform: scale(1.03);
-        }}
+        }
         
-        .no-cover {{
+        .no-cover {
             display: flex;
             align-items: center;
             justify-content: center;
             height: 100%;
             color: var(--secondary-text);
             font-size: 14px;
-        }}
+        }
         
-        .chapter-info {{
+        .chapter-info {
             padding: 14px;
-        }}
+        }
         
-        .chapter-name {{
+        .chapter-name {
             font-size: 15px;
             font-weight: 500;
             margin-bottom: 3px;
@@ -154,47 +128,403 @@ def generate_index_html(base_dir):
             white-space: nowrap;
             overflow: hidden;
             text-overflow: ellipsis;
-        }}
+        }
         
-        .chapter-number {{
+        .chapter-number {
             font-size: 13px;
             color: var(--secondary-text);
-        }}
+        }
         
-        @media (max-width: 768px) {{
-            .chapters-grid {{
+        @media (max-width: 768px) {
+            .chapters-grid {
                 grid-template-columns: repeat(auto-fill, minmax(150px, 1fr));
                 gap: 15px;
-            }}
+            }
             
-            .cover-container {{
+            .cover-container {
                 height: 200px;
-            }}
+            }
             
-            .title {{
+            .title {
                 font-size: 24px;
-            }}
-        }}
+            }
+        }
         
-        @media (max-width: 480px) {{
-            .chapters-grid {{
+        @media (max-width: 480px) {
+            .chapters-grid {
                 grid-template-columns: repeat(auto-fill, minmax(130px, 1fr));
                 gap: 12px;
-            }}
+            }
             
-            .cover-container {{
+            .cover-container {
                 height: 180px;
-            }}
+            }
             
-            .chapter-info {{
+            .chapter-info {
                 padding: 12px;
-            }}
+            }
             
-            .chapter-name {{
+            .chapter-name {
                 font-size: 14px;
+            }
+        }
+        .search {
+            display: block;
+            width: 100%;
+            max-width: 420px;
+            margin: 15px auto 0;
+            padding: 8px 12px;
+            font-size: 14px;
+            border: 1px solid var(--border-color);
+            border-radius: 6px;
+        }
+
+        .series-title {
+            grid-column: 1 / -1;
+            font-size: 20px;
+            font-weight: 600;
+            margin-top: 10px;
+            padding-bottom: 5px;
+            border-bottom: 1px solid var(--border-color);
+        }
+"""
+
+APP_TEMPLATE = """<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Biblioteca de Mangás</title>
+    <link rel="stylesheet" href="{stylesheet}">
+</head>
+<body>
+    <div class="header">
+        <h1 class="title">{title}</h1>
+        <p class="subtitle" id="subtitle"></p>
+        <input class="search" id="search" type="search" placeholder="Buscar série ou capítulo...">
+    </div>
+
+    <div class="library-container">
+        <div class="chapters-grid" id="grid"></div>
+        <div id="sentinel"></div>
+    </div>
+
+    <script src="catalog.js"></script>
+    <script>
+        const PAGE_SIZE = {page_size};
+        const series = window.LIBRARY_CATALOG.series;
+        const grid = document.getElementById('grid');
+        const search = document.getElementById('search');
+        const subtitle = document.getElementById('subtitle');
+        let items = [];
+        let rendered = 0;
+
+        function filterItems(query) {{
+            const q = query.trim().toLowerCase();
+            const result = [];
+            let total = 0;
+            for (const s of series) {{
+                const seriesMatch = s.name.toLowerCase().includes(q);
+                const chapters = s.chapters.filter(c => !q || seriesMatch || ('capítulo ' + c[0]).includes(q));
+                if (!chapters.length) continue;
+                total += chapters.length;
+                result.push({{header: s.name}});
+                for (const c of chapters) result.push({{series: s.name, chapter: c}});
             }}
+            subtitle.textContent = total + ' capítulos disponíveis';
+            return result;
         }}
-    </style>
+
+        function buildCard(item) {{
+            if (item.header) {{
+                const title = document.createElement('h2');
+                title.className = 'series-title';
+                title.textContent = item.header;
+                return title;
+            }}
+            const [number, href, cover, width, height] = item.chapter;
+            const card = document.createElement('a');
+            card.className = 'chapter-card';
+            card.href = href;
+            const coverBox = document.createElement('div');
+            coverBox.className = 'cover-container';
+            if (cover) {{
+                const img = document.createElement('img');
+                img.className = 'chapter-cover';
+                img.alt = 'Capa';
+                img.loading = 'lazy';
+                img.decoding = 'async';
+                if (width) {{ img.width = width; img.height = height; }}
+                img.src = cover;
+                coverBox.appendChild(img);
+            }} else {{
+                const empty = document.createElement('div');
+                empty.className = 'no-cover';
+                empty.textContent = 'Sem imagem';
+                coverBox.appendChild(empty);
+            }}
+            const info = document.createElement('div');
+            info.className = 'chapter-info';
+            const name = document.createElement('h3');
+            name.className = 'chapter-name';
+            name.textContent = item.series;
+            const num = document.createElement('p');
+            num.className = 'chapter-number';
+            num.textContent = 'Capítulo ' + number;
+            info.append(name, num);
+            card.append(coverBox, info);
+            return card;
+        }}
+
+        function renderMore() {{
+            const end = Math.min(rendered + PAGE_SIZE, items.length);
+            const fragment = document.createDocumentFragment();
+            for (let i = rendered; i < end; i++) fragment.appendChild(buildCard(items[i]));
+            grid.appendChild(fragment);
+            rendered = end;
+        }}
+
+        function reset() {{
+            grid.textContent = '';
+            rendered = 0;
+            items = filterItems(search.value);
+            renderMore();
+        }}
+
+        // Renderiza o próximo bloco quando o fim da lista se aproxima da tela
+        new IntersectionObserver(entries => {{
+            if (entries[0].isIntersecting && rendered < items.length) renderMore();
+        }}, {{rootMargin: '800px'}}).observe(document.getElementById('sentinel'));
+
+        let timer = null;
+        search.addEventListener('input', () => {{
+            clearTimeout(timer);
+            timer = setTimeout(reset, 150);
+        }});
+        reset();
+    </script>
+</body>
+</html>
+"""
+
+def load_catalog(base_dir):
+    try:
+        with open(os.path.join(base_dir, CATALOG_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f).get('chapters', {})
+    except FileNotFoundError:
+        return {}
+    except (ValueError, OSError) as e:
+        print(f"Catálogo inválido, reconstruindo: {e}")
+        return {}
+
+def load_index_mode(base_dir):
+    # Modo ('static' ou 'app') do último index.html gerado
+    try:
+        with open(os.path.join(base_dir, CATALOG_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f).get('mode')
+    except (ValueError, OSError):
+        return None
+
+def save_catalog(base_dir, catalog, mode=None):
+    catalog_path = os.path.join(base_dir, CATALOG_NAME)
+    mode = mode or load_index_mode(base_dir)
+    with atomic_writer(catalog_path) as f:
+        json.dump({'chapters': catalog, 'mode': mode}, f, indent=1, sort_keys=True)
+
+def scan_chapter(base_dir, item):
+    item_path = os.path.join(base_dir, item)
+    if not os.path.exists(os.path.join(item_path, "leitor.html")):
+        return None
+
+    chapter_name = item.replace("_", " ").replace("capitulo", "Capítulo")
+
+    # Caminho relativo da capa
+    cover_rel = os.path.join(item, "pages", "page_02.png")
+    cover_abs = os.path.join(base_dir, cover_rel)
+
+    # Capítulos empacotados: a lista de páginas sai do CBZ, com uma só abertura
+    archived = set(ChapterArchive(item_path).names())
+    if not os.path.exists(cover_abs) and os.path.basename(cover_rel) not in archived:
+        pages_dir = os.path.join(item_path, "pages")
+        loose = os.listdir(pages_dir) if os.path.isdir(pages_dir) else []
+        pages = sorted([f for f in archived.union(loose)
+                      if '/' not in f and f.lower().endswith(IMAGE_EXTENSIONS)])
+        if len(pages) >= 2:
+            cover_rel = os.path.join(item, "pages", pages[1])
+        elif pages:
+            cover_rel = os.path.join(item, "pages", pages[0])
+        else:
+            cover_rel = None
+
+    return {
+        'path': item,
+        'name': chapter_name,
+        'cover': cover_rel if cover_rel and (os.path.exists(os.path.join(base_dir, cover_rel))
+                                             or os.path.basename(cover_rel) in archived) else None,
+        'leitor': os.path.join(item, "leitor.html")
+    }
+
+def cover_state(base_dir, chapter):
+    # Capa e mtime dela (ou do CBZ, se ela estiver empacotada)
+    try:
+        mtime = os.stat(os.path.join(base_dir, chapter['cover'])).st_mtime_ns
+    except FileNotFoundError:
+        mtime = chapter.get('archive_mtime')
+    return [chapter['cover'], mtime]
+
+def update_catalog(base_dir):
+    # Só reexamina capítulos cuja pasta (ou pasta de páginas) mudou desde a última execução
+    previous = load_catalog(base_dir)
+    catalog = {}
+    changed = False
+
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir() or "_capitulo_" not in entry.name:
+                continue
+            mtime = entry.stat().st_mtime_ns
+            try:
+                pages_mtime = os.stat(os.path.join(entry.path, "pages")).st_mtime_ns
+            except FileNotFoundError:
+                pages_mtime = None
+            # O CBZ cresce no lugar, sem mudar o mtime da pasta do capítulo
+            try:
+                archive_mtime = os.stat(archive_path(entry.path)).st_mtime_ns
+            except FileNotFoundError:
+                archive_mtime = None
+
+            cached = previous.get(entry.name)
+            if (cached and cached['mtime'] == mtime and cached['pages_mtime'] == pages_mtime
+                    and cached.get('archive_mtime') == archive_mtime):
+                catalog[entry.name] = dict(cached)
+                continue
+
+            chapter = scan_chapter(base_dir, entry.name) or {'path': entry.name, 'invalid': True}
+            # Mudanças que não alteram o card (ex.: páginas novas) não regeneram o índice
+            if cached is None or chapter != {k: v for k, v in cached.items() if k not in CATALOG_STATE_KEYS}:
+                changed = True
+            # Mesma capa: a miniatura já gerada (ou a falha ao gerá-la) continua valendo
+            if cached and cached.get('thumb') and cached.get('cover') == chapter.get('cover'):
+                chapter.update({k: cached[k] for k in ('thumb', 'thumb_width', 'thumb_height')})
+            elif cached and cached.get('thumb_failed'):
+                chapter['thumb_failed'] = cached['thumb_failed']
+            chapter.update(mtime=mtime, pages_mtime=pages_mtime, archive_mtime=archive_mtime)
+            catalog[entry.name] = chapter
+
+    changed = changed or catalog.keys() != previous.keys()
+
+    # Miniaturas só para capítulos novos ou alterados (ou se a pasta sumiu)
+    thumbs_exist = os.path.isdir(os.path.join(base_dir, THUMB_DIR))
+    # Capas que já falharam (arquivo corrompido, formato sem suporte) só são
+    # tentadas de novo quando mudam
+    covers = {
+        item: chapter['cover'] for item, chapter in catalog.items()
+        if chapter.get('cover') and (not chapter.get('thumb') or not thumbs_exist)
+        and chapter.get('thumb_failed') != cover_state(base_dir, chapter)
+    }
+    if covers:
+        thumbs = generate_thumbnails(base_dir, covers)
+        for item in covers:
+            if item in thumbs:
+                thumb, width, height = thumbs[item]
+                catalog[item].update(thumb=thumb, thumb_width=width, thumb_height=height)
+                catalog[item].pop('thumb_failed', None)
+                changed = True
+            else:
+                catalog[item]['thumb_failed'] = cover_state(base_dir, catalog[item])
+                # Miniatura antiga que sumiu com a pasta: o card volta para a capa
+                if catalog[item].pop('thumb', None):
+                    catalog[item].pop('thumb_width', None)
+                    catalog[item].pop('thumb_height', None)
+                    changed = True
+
+    if catalog != previous:
+        save_catalog(base_dir, catalog)
+    return catalog, changed
+
+def chapter_series(path):
+    return path.split('_capitulo_')[0]
+
+def chapter_number(path):
+    match = re.search(r'\d+(?:\.\d+)?', path.split('_capitulo_')[-1])
+    return float(match.group()) if match else 0
+
+def chapter_sort_key(chapter):
+    return (chapter_series(chapter['path']).lower(), chapter_number(chapter['path']))
+
+def build_public_catalog(chapters):
+    # Formato compacto: cada capítulo é [número, leitor, capa, largura, altura]
+    series = {}
+    for chapter in sorted(chapters, key=chapter_sort_key):
+        name = chapter_series(chapter['path']).replace('_', ' ')
+        series.setdefault(name, []).append([
+            chapter['path'].split('_capitulo_')[-1],
+            chapter['leitor'],
+            chapter.get('thumb') or chapter.get('cover'),
+            chapter.get('thumb_width'),
+            chapter.get('thumb_height')
+        ])
+    return {'series': [{'name': name, 'chapters': items} for name, items in series.items()]}
+
+def generate_library_app(base_dir, chapters):
+    # O catálogo vai num .js (e não .json) para funcionar abrindo o index via file://
+    catalog_path = os.path.join(base_dir, "catalog.js")
+    catalog_json = json.dumps(build_public_catalog(chapters), ensure_ascii=False, separators=(',', ':'))
+    with atomic_writer(catalog_path) as f:
+        f.write(f"window.LIBRARY_CATALOG = {catalog_json};\n")
+
+    index_path = os.path.join(base_dir, "index.html")
+    write_stylesheet(os.path.join(base_dir, INDEX_STYLESHEET), INDEX_STYLE)
+    with atomic_writer(index_path) as f:
+        f.write(APP_TEMPLATE.format(
+            title=os.path.basename(base_dir),
+            stylesheet=INDEX_STYLESHEET,
+            page_size=APP_PAGE_SIZE
+        ))
+
+    print(f"Index gerado com sucesso ({len(chapters)} capítulos, modo paginado): {index_path}")
+    return True
+
+def generate_index_html(base_dir, force=False, mode=INDEX_MODE):
+    index_path = os.path.join(base_dir, "index.html")
+    catalog, changed = update_catalog(base_dir)
+    chapters = [chapter for chapter in catalog.values() if not chapter.get('invalid')]
+
+    if not chapters:
+        print("Nenhum capítulo válido encontrado para gerar o índice.")
+        return False
+
+    if mode == 'auto':
+        mode = 'app' if len(chapters) > LARGE_LIBRARY else 'static'
+    # Trocar o INDEX_MODE (ou passar do LARGE_LIBRARY) também regenera o índice
+    if mode != load_index_mode(base_dir):
+        changed = True
+
+    if not changed and not force and os.path.exists(index_path):
+        print(f"Index já está atualizado: {index_path}")
+        return True
+
+    if mode == 'app':
+        generate_library_app(base_dir, chapters)
+        save_catalog(base_dir, catalog, mode)
+        return True
+
+    # O catalog.js de um modo paginado anterior não é mais usado
+    catalog_js = os.path.join(base_dir, "catalog.js")
+    if os.path.exists(catalog_js):
+        os.remove(catalog_js)
+
+    chapters.sort(key=chapter_sort_key)
+    
+    write_stylesheet(os.path.join(base_dir, INDEX_STYLESHEET), INDEX_STYLE)
+    with atomic_writer(index_path) as f:
+        f.write(f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Biblioteca de Mangás</title>
+    <link rel="stylesheet" href="{INDEX_STYLESHEET}">
 </head>
 <body>
     <div class="header">
@@ -204,13 +534,19 @@ def generate_index_html(base_dir):
     
     <div class="library-container">
         <div class="chapters-grid">
-"""
+""")
 
-    for chapter in chapters:
-        cover_html = f'<img src="{chapter["cover"]}" class="chapter-cover" alt="Capa">' if chapter["cover"] else '<div class="no-cover">Sem imagem</div>'
-        chapter_num = ''.join(filter(str.isdigit, chapter['path'].split('_capitulo_')[-1]))
+        for chapter in chapters:
+            if chapter.get("thumb"):
+                cover_html = (f'<img src="{chapter["thumb"]}" class="chapter-cover" alt="Capa" '
+                              f'width="{chapter["thumb_width"]}" height="{chapter["thumb_height"]}" loading="lazy" decoding="async">')
+            elif chapter["cover"]:
+                cover_html = f'<img src="{chapter["cover"]}" class="chapter-cover" alt="Capa" loading="lazy">'
+            else:
+                cover_html = '<div class="no-cover">Sem imagem</div>'
+            chapter_num = chapter['path'].split('_capitulo_')[-1]
         
-        html_content += f"""
+            f.write(f"""
             <a href="{chapter['leitor']}" class="chapter-card">
                 <div class="cover-container">
                     {cover_html}
@@ -220,18 +556,16 @@ def generate_index_html(base_dir):
                     <p class="chapter-number">Capítulo {chapter_num}</p>
                 </div>
             </a>
-"""
+""")
 
-    html_content += """
+        f.write("""
         </div>
     </div>
 </body>
 </html>
-"""
-    
-    with open(index_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+""")
     
+    save_catalog(base_dir, catalog, mode)
     print(f"Index gerado com sucesso: {index_path}")
     return True
 if __name__ == "__main__":
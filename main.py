@@ -2,17 +2,183 @@ import os
 import re
 import time
 import json
+import hashlib
+import queue
+import threading
+from collections import deque
+from itertools import islice, groupby
 import requests
 from PIL import Image
 from tqdm import tqdm
-from io import BytesIO
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse, urljoin
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from manifest import ChapterManifest
+from archive import ChapterArchive, pack_chapter
+from blobstore import BlobStore, BLOB_DIR
+from html_writer import atomic_writer, write_stylesheet
+from ratelimit import AdaptiveHostLimiter, parse_retry_after
+from retry import RetryPolicy, TIMEOUT
+from transcode import PageTranscoder, slice_strip, TILE_HEIGHT
+from memory import default_budget, decoded_size
+from metrics import metrics, profiling
+from httpcache import HttpCache, CachingAdapter, CACHE_DIR
+from toc import discover_chapters, same_chapter
+from srcset import image_candidates, default_selector
+from driver_pool import DriverPool, DRIVER_POOL_SIZE
+from fetchers import (
+    IMAGE_SELECTOR, HttpPageFetcher, SeleniumPageFetcher, AutoPageFetcher, sync_session_from_driver
+)
 from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import WebDriverException, TimeoutException
+from selenium.common.exceptions import WebDriverException
+
+# Downloads simultâneos por capítulo e limite de conexões abertas por host
+MAX_WORKERS = 8
+MAX_PER_HOST = 4
+# Conexões mantidas abertas por host no pool HTTP compartilhado
+POOL_SIZE = 16
+# Capítulos aguardando download (limita a memória usada pelo pipeline)
+QUEUE_DEPTH = 3
+# 'auto' tenta o HTML estático e só abre o Chrome se não houver imagens;
+# 'http' e 'selenium' forçam um dos dois
+PAGE_FETCHER = 'auto'
+# 'toc' lê a lista de capítulos da série uma vez (números reais, páginas
+# buscadas em paralelo); 'links' segue o botão de próximo capítulo
+CHAPTER_DISCOVERY = 'toc'
+# Páginas de capítulo buscadas ao mesmo tempo quando a lista é conhecida
+CHAPTER_FETCHES = DRIVER_POOL_SIZE
+BLOCKED_RESOURCES = ['*.css', '*.woff', '*.woff2', '*.ttf', '*.otf']
+# Idade (em segundos) a partir da qual páginas já baixadas são revalidadas
+# com ETag/Last-Modified; None nunca revalida
+REVALIDATE_AFTER = None
+# None grava os bytes originais; 'auto' repete a conversão antiga (PNG com
+# transparência, JPEG no resto); outro valor é um formato do Pillow ('WEBP', ...)
+CONVERT_FORMAT = None
+CHUNK_SIZE = 64 * 1024
+# 'dir' mantém as páginas soltas em pages/; 'cbz' empacota cada capítulo
+# processado num pages.cbz sem compressão (servido pelo serve.py)
+OUTPUT_BACKEND = 'dir'
+# Guarda cada imagem uma vez em .blobs/ e liga as páginas a ela (créditos e
+# banners repetidos ocupam espaço uma vez só); PERCEPTUAL_DEDUP também junta
+# imagens quase iguais do mesmo tamanho, pelo hash perceptual
+DEDUP_PAGES = True
+PERCEPTUAL_DEDUP = False
+# Fatia tiras longas (altura maior que SLICE_RATIO vezes a largura) em pedaços
+# de até TILE_HEIGHT pixels: page_005_t01, page_005_t02...
+SLICE_STRIPS = False
+SLICE_RATIO = 3
+# Arquivos gravados na pasta de saída com as medições de cada etapa
+# (JSON-lines por evento e texto do Prometheus); None desativa
+METRICS_JSONL = None
+METRICS_PROMETHEUS = None
+# Nome do arquivo .pstats para rodar com cProfile (todas as threads); None desativa
+PROFILE_OUTPUT = None
+# Cache HTTP em disco (páginas, imagens e HTML renderizado) em .http_cache/ na
+# pasta de saída: None desliga, 'on' usa e grava, 'offline' refaz a biblioteca
+# só com o que já está no cache, sem acessar o site
+HTTP_CACHE = None
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.avif', '.jxl')
+READER_STYLESHEET = "reader.css"
+# Largura exibida das páginas (a .page-container tem no máximo 1000px)
+READER_IMAGE_SIZES = "(max-width: 1000px) 100vw, 1000px"
+# Páginas do próximo capítulo que o leitor pede para o navegador pré-carregar
+PREFETCH_PAGES = 3
+READER_STYLE = """
+        body {
+            margin: 0;
+            padding: 0;
+            background-color: #0e0e0e;
+            color: #ccc;
+            font-family: Arial, sans-serif;
+        }
+        .header {
+            background-color: rgba(0,0,0,0.7);
+            padding: 5px 10px;
+            font-size: 0.9rem;
+            position: sticky;
+            top: 0;
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+        }
+        .header a {
+            color: #999;
+            text-decoration: none;
+            font-size: 0.8rem;
+        }
+        .page-container {
+            max-width: 1000px;
+            margin: auto;
+            padding: 0;
+        }
+        .page {
+            margin: 0;
+        }
+        .manga-page {
+            width: 100%;
+            height: auto;
+            display: block;
+            margin: 0 auto;
+        }
+        .page-number {
+            font-size: 0.7rem;
+            color: #555;
+            text-align: center;
+            margin: 5px 0;
+        }
+"""
+
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif', 'AVIF': '.avif'}
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def host_semaphore(url, limit=MAX_PER_HOST):
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(limit)
+        return _host_semaphores[host]
+
+def sniff_image_extension(header):
+    if header.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return '.gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return '.webp'
+    if header[4:8] == b'ftyp' and header[8:12] in (b'avif', b'avis'):
+        return '.avif'
+    return None
+
+def read_image_size(path):
+    # Image.open só lê o cabeçalho; a imagem não é decodificada
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None, None
+
+def page_sort_key(name):
+    # (página, pedaço): page_005_t02.jpg -> (5, 2); páginas inteiras têm pedaço 0
+    match = re.match(r'page_(\d+)(?:_t(\d+))?', name)
+    if match:
+        return int(match.group(1)), int(match.group(2) or 0)
+    return int(''.join(filter(str.isdigit, name)) or 0), 0
+
+def list_page_files(chapter_dir):
+    # Páginas soltas em pages/ mais as já empacotadas no CBZ do capítulo
+    pages_dir = os.path.join(chapter_dir, "pages")
+    files = set(ChapterArchive(chapter_dir).names())
+    if os.path.isdir(pages_dir):
+        files.update(os.listdir(pages_dir))
+    return sorted(
+        [f for f in files if '/' not in f and f.lower().endswith(IMAGE_EXTENSIONS)],
+        key=page_sort_key
+    )
 
 def sanitize_filename(name):
     name = re.sub(r"[\\/:*?\"<>|]", "", name)
@@ -21,22 +187,40 @@ def sanitize_filename(name):
     return name[:100]
 
 class MangaImageDownloader:
-    def __init__(self, chapter_url, output_dir, driver):
+    def __init__(self, chapter_url, output_dir, fetcher=None, session=None, max_workers=MAX_WORKERS, max_per_host=MAX_PER_HOST, revalidate_after=REVALIDATE_AFTER, convert=CONVERT_FORMAT, limiter=None, retry=None, backend=OUTPUT_BACKEND, blobs=None, slice_strips=SLICE_STRIPS, budget=None, variants=None):
         self.chapter_url = chapter_url
         self.output_dir = output_dir
         self.pages_dir = os.path.join(output_dir, "pages")
+        self.chapter_name = os.path.basename(output_dir)
         self.image_urls = []
-        self.driver = driver
+        self.page = None
+        self.session = session if session is not None else setup_session()
+        self.fetcher = fetcher if fetcher is not None else HttpPageFetcher(self.session)
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.revalidate_after = revalidate_after
+        self.convert = convert
+        self.limiter = limiter
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.missing_pages = []
+        # Ligações com os capítulos vizinhos, usadas para o prefetch do leitor
+        self.previous = None
+        self.next_chapter_dir = None
+        self.archive = ChapterArchive(output_dir) if backend == 'cbz' else None
+        self.blobs = blobs
+        self.slice_strips = slice_strips
+        self.budget = budget if budget is not None else default_budget
+        self.variants = variants if variants is not None else default_selector
         os.makedirs(self.pages_dir, exist_ok=True)
+        self.manifest = ChapterManifest(output_dir)
 
-    def fetch_image_urls(self):
+    def fetch_image_urls(self, page=None):
         try:
-            self.driver.get(self.chapter_url)
-            WebDriverWait(self.driver, 20).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "div.chapter-image-container img"))
-            )
-            soup = BeautifulSoup(self.driver.page_source, 'html.parser')
-            self.image_urls = self._extract_image_urls(soup)
+            # A página pode já ter sido carregada por quem criou o downloader
+            self.page = page if page is not None else self.fetcher.fetch(self.chapter_url)
+            with metrics.timer('extract', chapter=self.chapter_name) as sample:
+                self.image_urls = self._extract_image_urls(self.page.soup)
+                sample['images'] = len(self.image_urls)
 
             if not self.image_urls:
                 print("[AVISO] Nenhuma imagem encontrada.")
@@ -49,55 +233,265 @@ class MangaImageDownloader:
             return False
 
     def _extract_image_urls(self, soup):
-        image_urls = []
-        for img in soup.select('div.chapter-image-container img'):
-            srcset = img.get('srcset') or img.get('data-srcset')
-            if srcset:
-                highest_res_url = self._get_highest_resolution_url(srcset)
-                image_urls.append(highest_res_url)
-            else:
-                img_url = img.get('src') or img.get('data-src')
-                if img_url:
-                    image_urls.append(img_url)
-        return image_urls
-
-    def _get_highest_resolution_url(self, srcset):
-        srcset_urls = [s.strip().split() for s in srcset.split(',')]
-        return sorted(srcset_urls, key=lambda x: int(x[1].replace('w', '')), reverse=True)[0][0]
+        # Uma lista de variantes (srcset + src) por imagem; a política decide qual baixar
+        pages = []
+        for img in soup.select(IMAGE_SELECTOR):
+            candidates = image_candidates(img, self.chapter_url)
+            if candidates:
+                pages.append(candidates)
+        return self.variants.choose(pages, self.session, self.chapter_url)
+
+    def download_image(self, url, page):
+        try:
+            return self.retry.call(self._download_limited, url, page, description=f"Download de {page}")
+        except Exception as e:
+            print(f"[ERRO] Falha ao baixar {url}: {e}")
+            return None
 
-    def download_image(self, url, filename):
+    def _download_limited(self, url, page):
+        if self.limiter is not None:
+            self.limiter.wait(url)
+        with host_semaphore(url, self.max_per_host):
+            return self._fetch_page(url, page)
+
+    def request_headers(self, page, url, entry):
+        headers = {'Referer': self.chapter_url}
+        if self.manifest.is_complete(page, url):
+            # Página já baixada: pergunta ao servidor se ela mudou
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _fetch_page(self, url, page):
+        entry = self.manifest.get(page)
+        headers = self.request_headers(page, url, entry)
+        tmp_path = os.path.join(self.pages_dir, page + ".part")
+        labels = {'chapter': self.chapter_name, 'page': page}
         try:
-            response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0', 'Referer': self.chapter_url})
-            response.raise_for_status()
-            img = Image.open(BytesIO(response.content))
+            start = time.perf_counter()
+            with self.session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                # Com stream=True o get volta ao receber os cabeçalhos: é a latência
+                metrics.record('latency', time.perf_counter() - start, status=response.status_code, **labels)
+                if self.limiter is not None:
+                    self.limiter.observe(url, response.status_code, parse_retry_after(response.headers.get('Retry-After')))
+                if response.status_code == 304:
+                    return self.not_modified(page, entry)
+                response.raise_for_status()
+
+                # Grava os bytes originais em blocos, sem decodificar a imagem
+                hasher = hashlib.sha256()
+                size = 0
+                write_time = 0
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        hasher.update(chunk)
+                        size += len(chunk)
+                        write_start = time.perf_counter()
+                        f.write(chunk)
+                        write_time += time.perf_counter() - write_start
+                metrics.record('download', time.perf_counter() - start, bytes=size, **labels)
+                metrics.record('write', write_time, bytes=size, **labels)
+            return self.store_page(page, url, entry, tmp_path, response.headers, size, hasher.hexdigest())
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def not_modified(self, page, entry):
+        self.manifest.update(page, checked_at=time.time())
+        return os.path.join(self.pages_dir, entry['file']) if entry.get('file') else self.pages_dir
+
+    def store_page(self, page, url, entry, tmp_path, headers, size, sha256):
+        # Do arquivo baixado em tmp_path até a página final registrada no manifesto;
+        # usado também pelo modo assíncrono, que só troca a forma de baixar
+        labels = {'chapter': self.chapter_name, 'page': page}
+        try:
+            with open(tmp_path, 'rb') as f:
+                extension = sniff_image_extension(f.read(32))
+            if extension is None:
+                raise ValueError(f"conteúdo não reconhecido como imagem ({headers.get('Content-Type')})")
+
+            if self.convert:
+                with metrics.timer('convert', **labels):
+                    filename = self._convert_image(tmp_path, page)
+            else:
+                filename = page + extension
+                os.replace(tmp_path, os.path.join(self.pages_dir, filename))
+            page_path = os.path.join(self.pages_dir, filename)
+            width, height = read_image_size(page_path)
+
+            # Remove a versão anterior se a extensão mudou (ou se ela foi fatiada)
+            if entry and entry.get('file') and entry['file'] != filename:
+                old_path = os.path.join(self.pages_dir, entry['file'])
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+            self._remove_tiles(entry)
+
+            blob = None
+            tiles = None
+            if self.slice_strips and self._is_strip(page_path, width, height):
+                tiles = self._slice_page(page, page_path, sha256)
+                filename = None
+            elif self.blobs is not None:
+                # Conteúdo repetido (em qualquer capítulo) vira um link para o mesmo blob
+                blob = self.blobs.add(page_path, sha256 + os.path.splitext(filename)[1])
+
+            self.manifest.update(
+                page,
+                url=url,
+                file=filename,
+                etag=headers.get('ETag'),
+                last_modified=headers.get('Last-Modified'),
+                size=size,
+                sha256=sha256,
+                width=width,
+                height=height,
+                checked_at=time.time(),
+                transcode=None,
+                variants=None,
+                archived=False,
+                blob=blob,
+                source=None,
+                tiles=tiles
+            )
+            return page_path
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _is_strip(self, path, width, height):
+        if not width or height <= max(SLICE_RATIO * width, TILE_HEIGHT):
+            return False
+        return os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp')
+
+    def _slice_page(self, page, page_path, sha256):
+        # Decodificar a tira inteira é o pico de memória: passa pelo orçamento
+        with self.budget.reserve(decoded_size(page_path)):
+            with metrics.timer('slice', chapter=self.chapter_name, page=page):
+                tiles = slice_strip(page_path)
+        names = []
+        for filename, width, height in tiles:
+            tile = os.path.splitext(filename)[0]
+            blob = None
+            if self.blobs is not None:
+                suffix = tile[len(page):]
+                blob = self.blobs.add(os.path.join(self.pages_dir, filename), f"{sha256}{suffix}{os.path.splitext(filename)[1]}")
+            self.manifest.update(tile, file=filename, width=width, height=height, tile_of=page,
+                                 blob=blob, source=None, transcode=None, variants=None, archived=False)
+            names.append(tile)
+        print(f"[INFO] {page} fatiada em {len(names)} pedaços")
+        return names
+
+    def _remove_tiles(self, entry):
+        for tile in (entry or {}).get('tiles') or []:
+            tile_entry = self.manifest.get(tile) or {}
+            if tile_entry.get('file'):
+                tile_path = os.path.join(self.pages_dir, tile_entry['file'])
+                if os.path.exists(tile_path):
+                    os.remove(tile_path)
+            self.manifest.remove(tile)
+
+    def _convert_image(self, src_path, page):
+        # A imagem inteira é decodificada: passa pelo orçamento de memória
+        with self.budget.reserve(decoded_size(src_path)):
+            img = Image.open(src_path)
             if img.mode == "P":
                 img = img.convert("RGB")
 
-            img_format = 'PNG' if img.mode in ('RGBA', 'LA') else 'JPEG'
+            if self.convert == 'auto':
+                img_format = 'PNG' if img.mode in ('RGBA', 'LA') else 'JPEG'
+            else:
+                img_format = self.convert.upper()
+            if img_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+                img = img.convert("RGB")
+
+            filename = page + FORMAT_EXTENSIONS.get(img_format, '.' + img_format.lower())
             img_path = os.path.join(self.pages_dir, filename)
-            img.save(img_path, format=img_format, optimize=True)
-            return img_path
-        except Exception as e:
-            print(f"[ERRO] Falha ao baixar {url}: {e}")
-            return None
+            img.save(img_path + ".part", format=img_format, optimize=True)
+            img.close()
+            os.replace(img_path + ".part", img_path)
+            os.remove(src_path)
+            return filename
 
     def download_all_pages(self):
         success = self.fetch_image_urls()
         if not success:
             return False
-        
-        print(f"[INFO] Baixando {len(self.image_urls)} imagens para {self.pages_dir}")
-        for i, url in enumerate(tqdm(self.image_urls, desc="Baixando Imagens", unit="imagem")):
-            self.download_image(url, f"page_{i + 1:03d}.png")
-        
+        return self.download_pages()
+
+    def pending_pages(self):
+        # Páginas já registradas no manifesto só são baixadas de novo quando
+        # ficam mais antigas que REVALIDATE_AFTER (via requisição condicional)
+        pending = []
+        for i, url in enumerate(self.image_urls):
+            page = f"page_{i + 1:03d}"
+            if self.manifest.is_complete(page, url) and not self.manifest.is_stale(page, self.revalidate_after):
+                continue
+            pending.append((url, page))
+
+        skipped = len(self.image_urls) - len(pending)
+        if skipped:
+            print(f"[INFO] {skipped} imagens já baixadas anteriormente, pulando")
+        print(f"[INFO] Baixando {len(pending)} imagens para {self.pages_dir}")
+        return pending
+
+    def download_pages(self):
+        pending = self.pending_pages()
+        # O nome do arquivo é definido pelo índice, então a ordem das páginas
+        # não depende da ordem em que os downloads terminam
+        missing = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.download_image, url, page): (url, page)
+                for url, page in pending
+            }
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Baixando Imagens", unit="imagem"):
+                if future.result() is None:
+                    url, page = futures[future]
+                    missing.append({'page': page, 'url': url})
+        return self.finish_pages(missing)
+
+    def finish_pages(self, missing):
+        # O relatório fica no manifesto para que as páginas possam ser repetidas depois
+        self.missing_pages = sorted(missing, key=lambda m: m['page'])
+        self.manifest.set_missing(self.missing_pages)
+        if self.missing_pages:
+            pages = ", ".join(m['page'] for m in self.missing_pages)
+            print(f"[AVISO] {len(self.missing_pages)} páginas não foram baixadas em {self.pages_dir}: {pages}")
+            return False
+
         print(f"[SUCESSO] Todas as imagens foram salvas em: {self.pages_dir}")
         return True
 
+    def _image_attributes(self, entry, page_path):
+        if not entry or not entry.get('width'):
+            return ""
+        attributes = f' width="{entry["width"]}" height="{entry["height"]}"'
+        variants = (entry.get('variants') or {}).get('items')
+        if variants:
+            candidates = [f'{os.path.join("pages", v["file"])} {v["width"]}w' for v in variants]
+            candidates.append(f'{page_path} {entry["width"]}w')
+            attributes += f' srcset="{", ".join(candidates)}" sizes="{READER_IMAGE_SIZES}"'
+        return attributes
+
+    def _prefetch_links(self):
+        if not self.next_chapter_dir:
+            return ""
+        next_name = os.path.basename(self.next_chapter_dir)
+        links = [f'\n    <link rel="prefetch" href="../{next_name}/leitor.html">']
+        for page_file in list_page_files(self.next_chapter_dir)[:PREFETCH_PAGES]:
+            links.append(f'\n    <link rel="prefetch" href="../{next_name}/pages/{page_file}">')
+        return "".join(links)
+
     def generate_html_reader(self):
-        page_files = sorted(
-            [f for f in os.listdir(self.pages_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))],
-            key=lambda x: int(''.join(filter(str.isdigit, x)))
-        )
+        with metrics.timer('html', chapter=self.chapter_name):
+            return self._generate_html_reader()
+
+    def _generate_html_reader(self):
+        page_files = list_page_files(self.output_dir)
         
         if not page_files:
             print(f"[ERRO] Nenhuma imagem encontrada na pasta {self.pages_dir}")
@@ -107,57 +501,23 @@ class MangaImageDownloader:
         manga_name = chapter_name.split('_capitulo_')[0].replace('_', ' ').title()
         chapter_num = chapter_name.split('_capitulo_')[-1]
         index_path = os.path.relpath(os.path.join(self.output_dir, "..", "index.html"), start=self.output_dir)
+
+        # O CSS fica num arquivo único na pasta da biblioteca, compartilhado pelos leitores
+        library_dir = os.path.dirname(os.path.abspath(self.output_dir))
+        write_stylesheet(os.path.join(library_dir, READER_STYLESHEET), READER_STYLE)
         
-        html_content = f"""<!DOCTYPE html>
+        # Dimensões e variantes registradas no download evitam reflow no navegador
+        pages_by_file = {entry.get('file'): entry for _, entry in self.manifest.items()}
+
+        output_html = os.path.join(self.output_dir, "leitor.html")
+        with atomic_writer(output_html) as f:
+            f.write(f"""<!DOCTYPE html>
     <html lang="pt-BR">
     <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>{manga_name} - Capítulo {chapter_num}</title>
-    <style>
-        body {{
-            margin: 0;
-            padding: 0;
-            background-color: #0e0e0e;
-            color: #ccc;
-            font-family: Arial, sans-serif;
-        }}
-        .header {{
-            background-color: rgba(0,0,0,0.7);
-            padding: 5px 10px;
-            font-size: 0.9rem;
-            position: sticky;
-            top: 0;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .header a {{
-            color: #999;
-            text-decoration: none;
-            font-size: 0.8rem;
-        }}
-        .page-container {{
-            max-width: 1000px;
-            margin: auto;
-            padding: 0;
-        }}
-        .page {{
-            margin: 0;
-        }}
-        .manga-page {{
-            width: 100%;
-            height: auto;
-            display: block;
-            margin: 0 auto;
-        }}
-        .page-number {{
-            font-size: 0.7rem;
-            color: #555;
-            text-align: center;
-            margin: 5px 0;
-        }}
-    </style>
+    <link rel="stylesheet" href="../{READER_STYLESHEET}">{self._prefetch_links()}
     </head>
     <body>
 
@@ -167,238 +527,272 @@ class MangaImageDownloader:
     </div>
 
     <div class="page-container">
-    """
-
-        for i, page_file in enumerate(page_files, 1):
-            page_path = os.path.join("pages", page_file)
-            html_content += f"""
-        <div class="page">
-            <img class="manga-page" src="{page_path}" alt="Página {i}" loading="lazy">
+    """)
+
+            # Pedaços de uma tira fatiada ficam juntos, na ordem, numa única página
+            page_groups = groupby(page_files, key=lambda x: page_sort_key(x)[0])
+            for i, (_, group) in enumerate(page_groups, 1):
+                f.write("""
+        <div class="page">""")
+                for page_file in group:
+                    page_path = os.path.join("pages", page_file)
+                    f.write(f"""
+            <img class="manga-page" src="{page_path}" alt="Página {i}" loading="lazy"{self._image_attributes(pages_by_file.get(page_file), page_path)}>""")
+                f.write(f"""
         </div>
         <div class="page-number">Página {i}</div>
-    """
+    """)
 
-        html_content += """
+            f.write("""
     </div>
     </body>
     </html>
-    """
-        
-        output_html = os.path.join(self.output_dir, "leitor.html")
-        with open(output_html, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+    """)
         
         print(f"[HTML] Gerado com sucesso: {output_html}")
         return True
 
 
-def get_next_chapter(driver):
-    try:
-        next_btn = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "a.next-chapter-btn"))
-        )
-        next_url = next_btn.get_attribute('href')
-        if next_url and next_url != driver.current_url:
+def get_next_chapter(page):
+    next_link = page.soup.select_one('a.next-chapter-btn') or \
+               page.soup.find('a', string=re.compile(r'próximo|next', re.IGNORECASE))
+    if next_link and next_link.get('href'):
+        next_url = urljoin(page.url, next_link['href'])
+        if next_url != page.url:
             print(f"[INFO] Próximo capítulo encontrado: {next_url}")
             return next_url
-    except:
-        print("[AVISO] Botão próximo não encontrado, tentando método alternativo...")
-        try:
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            next_link = soup.find('a', class_='next-chapter-btn') or \
-                       soup.find('a', string=re.compile(r'próximo|next', re.IGNORECASE))
-            if next_link and next_link.get('href'):
-                next_url = next_link['href']
-                if next_url != driver.current_url:
-                    print(f"[INFO] Próximo capítulo encontrado via HTML: {next_url}")
-                    return next_url
-        except Exception as e:
-            print(f"[ERRO] Método alternativo também falhou: {e}")
     print("[AVISO] Não foi possível encontrar o link para o próximo capítulo")
     return None
 
-def generate_html_reader(self):
-    page_files = sorted(
-        [f for f in os.listdir(self.pages_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))],
-        key=lambda x: int(''.join(filter(str.isdigit, x))))
-    
-    if not page_files:
-        print(f"[ERRO] Nenhuma imagem encontrada na pasta {self.pages_dir}")
-        return False
-    
-    chapter_name = os.path.basename(self.output_dir)
-    manga_name = chapter_name.split('_capitulo_')[0].replace('_', ' ').title()
-    chapter_num = chapter_name.split('_capitulo_')[-1]
-    index_path = os.path.relpath(os.path.join(self.output_dir, "..", "index.html"), start=self.output_dir)
-    
-    html_content = f"""<!DOCTYPE html>
-<html lang="pt-BR">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{manga_name} - Capítulo {chapter_num}</title>
-    <style>
-        :root {{
-            --bg-color: #1a1a1a;
-            --header-bg: #0d0d0d;
-            --text-color: #f0f0f0;
-            --secondary-text: #b3b3b3;
-            --accent-color: #4a6fa5;
-            --page-bg: #262626;
-        }}
-        
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            background-color: var(--bg-color);
-            color: var(--text-color);
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, sans-serif;
-            line-height: 1.6;
-        }}
-        
-        .header {{
-            background-color: var(--header-bg);
-            padding: 12px 16px;
-            position: sticky;
-            top: 0;
-            z-index: 100;
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.3);
-        }}
-        
-        .back-button {{
-            color: var(--secondary-text);
-            text-decoration: none;
-            font-size: 14px;
-            display: flex;
-            align-items: center;
-            transition: color 0.2s;
-        }}
-        
-        .back-button:hover {{
-            color: var(--accent-color);
-        }}
-        
-        .title-container {{
-            text-align: center;
-            flex-grow: 1;
-        }}
-        
-        .manga-title {{
-            font-size: 16px;
-            font-weight: 500;
-            margin-bottom: 2px;
-        }}
-        
-        .chapter-info {{
-            font-size: 13px;
-            color: var(--secondary-text);
-        }}
-        
-        .reader-container {{
-            max-width: 900px;
-            margin: 0 auto;
-            padding: 20px 10px;
-        }}
-        
-        .page-container {{
-            margin-bottom: 30px;
-            background-color: var(--page-bg);
-            border-radius: 4px;
-            overflow: hidden;
-            box-shadow: 0 3px 6px rgba(0,0,0,0.16);
-        }}
-        
-        .page-number {{
-            padding: 8px;
-            text-align: center;
-            font-size: 12px;
-            color: var(--secondary-text);
-            background-color: var(--header-bg);
-        }}
-        
-        .manga-page {{
-            width: 100%;
-            height: auto;
-            display: block;
-            margin: 0 auto;
-        }}
-        
-        @media (max-width: 768px) {{
-            .header {{
-                padding: 10px;
-            }}
-            
-            .manga-title {{
-                font-size: 15px;
-            }}
-            
-            .chapter-info {{
-                font-size: 12px;
-            }}
-            
-            .reader-container {{
-                padding: 15px 5px;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="header">
-        <a href="{index_path}" class="back-button">
-            <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
-                <path d="M19 12H5M12 19l-7-7 7-7"/>
-            </svg>
-            <span style="margin-left: 6px;">Voltar</span>
-        </a>
-        
-        <div class="title-container">
-            <div class="manga-title">{manga_name}</div>
-            <div class="chapter-info">Capítulo {chapter_num}</div>
-        </div>
-        
-        <div style="width: 58px;"></div> <!-- Espaçamento para alinhamento -->
-    </div>
-    
-    <div class="reader-container">
-"""
-
-    for i, page_file in enumerate(page_files, 1):
-        page_path = os.path.join("pages", page_file)
-        html_content += f"""
-        <div class="page-container">
-            <div class="page-number">Página {i}</div>
-            <img class="manga-page" src="{page_path}" alt="Página {i}" loading="lazy">
-        </div>
-"""
-
-    html_content += """
-    </div>
-</body>
-</html>
-"""
-    
-    output_html = os.path.join(self.output_dir, "leitor.html")
-    with open(output_html, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    print(f"[HTML] Gerado com sucesso: {output_html}")
-    return True
-
-def setup_driver():
+def setup_driver(block_resources=True):
     options = webdriver.ChromeOptions()
     options.add_argument('--headless')
     options.add_argument('--disable-gpu')
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
     options.add_argument('user-agent=Mozilla/5.0')
-    return webdriver.Chrome(options=options)
+    if block_resources:
+        # Só o DOM interessa: não carrega imagens, CSS nem fontes
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    driver = webdriver.Chrome(options=options)
+    if block_resources:
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_RESOURCES})
+        except WebDriverException:
+            pass
+    return driver
+
+def setup_session(driver=None, pool_size=POOL_SIZE, cache=None):
+    session = requests.Session()
+    if cache is not None:
+        adapter = CachingAdapter(cache, pool_connections=pool_size, pool_maxsize=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': 'Mozilla/5.0'})
+    if driver is not None:
+        sync_session_from_driver(session, driver)
+    return session
+
+def setup_fetcher(session, mode=PAGE_FETCHER, pool_size=DRIVER_POOL_SIZE, limiter=None, cache=None):
+    if mode == 'http':
+        return HttpPageFetcher(session, limiter)
+    selenium_fetcher = SeleniumPageFetcher(DriverPool(setup_driver, size=pool_size), session, cache)
+    if mode == 'selenium':
+        return selenium_fetcher
+    return AutoPageFetcher(HttpPageFetcher(session, limiter), selenium_fetcher)
+
+def iter_chapters(start_url, fetcher, throttle, first=1, discovery=CHAPTER_DISCOVERY):
+    # Gera (número, url, página já carregada ou None) a partir do start_url
+    throttle.wait(start_url)
+    page = fetcher.fetch(start_url)
+    chapters = discover_chapters(page, fetcher, throttle) if discovery == 'toc' else []
+    start = next((i for i, (_, url) in enumerate(chapters) if same_chapter(url, start_url)), None)
+    if start is not None:
+        print(f"[INFO] Lista de capítulos encontrada: {len(chapters) - start} a partir de {start_url}")
+        yield chapters[start][0], start_url, page
+        for number, url in chapters[start + 1:]:
+            yield number, url, None
+        return
+
+    # Sem sumário: percorre os capítulos um a um pelo link de próximo
+    chapter_num = first
+    while True:
+        yield chapter_num, page.url, page
+        next_url = get_next_chapter(page)
+        if not next_url:
+            print("[FIM] Sem próximos capítulos.")
+            return
+        chapter_num += 1
+        throttle.wait(next_url)
+        page = fetcher.fetch(next_url)
+
+def prepare_chapter(url, chapter_num, output_dir, fetcher, session, throttle, image_limiter=None, blobs=None, page=None):
+    if page is None:
+        throttle.wait(url)
+        page = fetcher.fetch(url)
+    title = page.title.split('|')[0].strip()
+    safe_title = sanitize_filename(title)
+
+    # Cria um subdiretório para o capítulo
+    chapter_dir = os.path.join(output_dir, f"{safe_title}_capitulo_{chapter_num}")
+    os.makedirs(chapter_dir, exist_ok=True)
+
+    downloader = MangaImageDownloader(
+        chapter_url=url,
+        output_dir=chapter_dir,
+        fetcher=fetcher,
+        session=session,
+        limiter=image_limiter,
+        blobs=blobs
+    )
+
+    # Busca as URLs das imagens
+    if not downloader.fetch_image_urls(page):
+        print(f"[AVISO] Falha ao buscar imagens do capítulo {chapter_num}")
+        return page, None
+    return page, downloader
+
+def chapter_producer(start_url, num_chapters, output_dir, fetcher, session, jobs, throttle, image_limiter=None, blobs=None):
+    previous = None
+    pending = deque()
+
+    def enqueue(chapter_num, future):
+        nonlocal previous
+        try:
+            _, downloader = future.result()
+        except Exception as e:
+            print(f"[ERRO] Capítulo {chapter_num}: {e}")
+            return
+        if downloader is None:
+            return
+        if previous is not None:
+            previous.next_chapter_dir = downloader.output_dir
+            downloader.previous = previous
+        previous = downloader
+        jobs.put((chapter_num, downloader))
+
+    # Com a lista de capítulos, várias páginas são buscadas ao mesmo tempo;
+    # a fila continua recebendo os capítulos na ordem
+    try:
+        with ThreadPoolExecutor(max_workers=CHAPTER_FETCHES) as executor:
+            for chapter_num, url, page in islice(iter_chapters(start_url, fetcher, throttle), num_chapters):
+                print(f"\n=== PROCESSANDO CAPÍTULO {chapter_num} ===")
+                pending.append((chapter_num, executor.submit(
+                    prepare_chapter, url, chapter_num, output_dir, fetcher, session, throttle, image_limiter, blobs, page
+                )))
+                if len(pending) >= CHAPTER_FETCHES:
+                    enqueue(*pending.popleft())
+            while pending:
+                enqueue(*pending.popleft())
+    except Exception as e:
+        print(f"[ERRO CRÍTICO] {start_url}: {e}")
+        while pending:
+            enqueue(*pending.popleft())
+
+def download_worker(jobs, transcoder=None):
+    retry_later = []
+    # Recompressão, CBZ e leitor rodam numa thread própria: os downloads do
+    # próximo capítulo não esperam o encode deste, e os capítulos terminam em ordem
+    with ThreadPoolExecutor(max_workers=1) as finisher:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            chapter_num, downloader = job
+            if not process_chapter(chapter_num, downloader, transcoder, finisher):
+                retry_later.append((chapter_num, downloader))
+
+    # Capítulos com páginas faltando voltam uma vez para o fim da fila;
+    # o manifesto faz com que só as páginas que faltam sejam baixadas
+    for chapter_num, downloader in retry_later:
+        print(f"[INFO] Repetindo {len(downloader.missing_pages)} páginas do capítulo {chapter_num}")
+        process_chapter(chapter_num, downloader, transcoder)
+
+def process_chapter(chapter_num, downloader, transcoder=None, finisher=None):
+    # Com um finisher (executor), a finalização do capítulo fica para ele e o
+    # retorno diz só se todas as páginas foram baixadas
+    with metrics.timer('chapter', chapter=downloader.chapter_name):
+        return _process_chapter(chapter_num, downloader, transcoder, finisher)
+
+def _process_chapter(chapter_num, downloader, transcoder=None, finisher=None):
+    try:
+        # Baixa todas as imagens
+        with metrics.timer('chapter_pages', chapter=downloader.chapter_name):
+            success = downloader.download_pages()
+        if not success:
+            print(f"[AVISO] Capítulo {chapter_num} incompleto, o leitor será gerado com as páginas disponíveis")
+        if finisher is not None:
+            finisher.submit(_finish_chapter, chapter_num, downloader, transcoder)
+        else:
+            finish_chapter(chapter_num, downloader, transcoder)
+        return success
+    except Exception as e:
+        print(f"[ERRO] Capítulo {chapter_num}: {e}")
+        return False
+
+def _finish_chapter(chapter_num, downloader, transcoder=None):
+    try:
+        finish_chapter(chapter_num, downloader, transcoder)
+    except Exception as e:
+        print(f"[ERRO] Capítulo {chapter_num}: {e}")
+
+def finish_chapter(chapter_num, downloader, transcoder=None):
+    # Recomprime as páginas em processos separados
+    if transcoder is not None:
+        with metrics.timer('chapter_encode', chapter=downloader.chapter_name):
+            transcoder.transcode_chapter(downloader.manifest)
+
+    # Com as páginas finais prontas, move tudo para o CBZ do capítulo
+    if downloader.archive is not None:
+        with metrics.timer('pack', chapter=downloader.chapter_name):
+            pack_chapter(downloader.manifest, downloader.archive)
+        # As páginas agora estão no CBZ: blobs sem outros links só ocupariam espaço
+        # (páginas arquivadas não são recomprimidas de novo, o original também sai)
+        if downloader.blobs is not None:
+            downloader.blobs.collect(
+                key for _, entry in downloader.manifest.items() for key in (entry.get('blob'), entry.get('source'))
+            )
+
+    # Gera o HTML do leitor
+    html_success = downloader.generate_html_reader()
+    if not html_success:
+        print(f"[AVISO] Falha ao gerar HTML para o capítulo {chapter_num}")
+
+    # Com as páginas deste capítulo no disco, o leitor anterior ganha o prefetch
+    previous, downloader.previous = downloader.previous, None
+    if previous is not None and os.path.exists(os.path.join(previous.output_dir, "leitor.html")):
+        previous.generate_html_reader()
+
+def run_pipeline(start_urls, num_chapters, output_dir, fetcher, session, transcoder, throttle, image_limiter, blobs):
+    # Os navegadores avançam pelos capítulos enquanto outras threads baixam as imagens.
+    # Uma fila e um worker por série: os capítulos de uma série terminam em ordem,
+    # e o leitor do anterior só é refeito depois que ele foi finalizado
+    queues = [queue.Queue(maxsize=QUEUE_DEPTH) for _ in start_urls]
+    workers = [
+        threading.Thread(target=download_worker, args=(jobs, transcoder), daemon=True)
+        for jobs in queues
+    ]
+    producers = [
+        threading.Thread(
+            target=chapter_producer,
+            args=(start_url, num_chapters, output_dir, fetcher, session, jobs, throttle, image_limiter, blobs),
+            daemon=True
+        )
+        for start_url, jobs in zip(start_urls, queues)
+    ]
+    for thread in workers + producers:
+        thread.start()
+    try:
+        for producer in producers:
+            producer.join()
+    finally:
+        for jobs in queues:
+            jobs.put(None)
+        for worker in workers:
+            worker.join()
 
 def main():
     default_dir = "/home/val/Documentos/Mangas"
@@ -407,51 +801,44 @@ def main():
     os.makedirs(output_dir, exist_ok=True)
 
     num_chapters = int(input("Quantidade de capitulos \n")) # ou input se quiser customizar
-    driver = setup_driver()
-
-    start_url = input("Digite o link do primeiro capítulo: ")
-    current_url = start_url
-
-    for chapter_num in range(1, num_chapters + 1):
+    blobs = BlobStore(os.path.join(output_dir, BLOB_DIR), perceptual=PERCEPTUAL_DEDUP) if DEDUP_PAGES else None
+    while True:
+        transcode_format = input("Formato para recomprimir as páginas (webp, avif, jpeg; Enter mantém o original): ").strip()
         try:
-            print(f"\n=== PROCESSANDO CAPÍTULO {chapter_num} ===")
-            driver.get(current_url)
-            title = driver.title.split('|')[0].strip()
-            safe_title = sanitize_filename(title)
-            
-            # Cria um subdiretório para o capítulo
-            chapter_dir = os.path.join(output_dir, f"{safe_title}_capitulo_{chapter_num}")
-            os.makedirs(chapter_dir, exist_ok=True)
-            
-            downloader = MangaImageDownloader(
-                chapter_url=current_url,
-                output_dir=chapter_dir,
-                driver=driver
-            )
-
-            # Baixa todas as imagens
-            success = downloader.download_all_pages()
-            if not success:
-                print(f"[AVISO] Falha ao baixar imagens do capítulo {chapter_num}")
-                continue
-
-            # Gera o HTML do leitor
-            html_success = downloader.generate_html_reader()
-            if not html_success:
-                print(f"[AVISO] Falha ao gerar HTML para o capítulo {chapter_num}")
-
-            current_url = get_next_chapter(driver)
-            if not current_url:
-                print("[FIM] Sem próximos capítulos.")
-                break
-
-            time.sleep(2)
-
-        except Exception as e:
-            print(f"[ERRO CRÍTICO] Capítulo {chapter_num}: {e}")
+            transcoder = PageTranscoder(transcode_format or None, blobs=blobs)
             break
-
-    driver.quit()
+        except ValueError as e:
+            print(f"[ERRO] {e}")
+    # Navegações começam espaçadas e aceleram conforme o host responde bem;
+    # imagens começam sem intervalo e só recuam diante de 429/5xx
+    throttle = AdaptiveHostLimiter()
+    image_limiter = AdaptiveHostLimiter(delay=0, min_delay=0)
+    cache = None
+    if HTTP_CACHE:
+        cache = HttpCache(os.path.join(output_dir, CACHE_DIR), offline=HTTP_CACHE == 'offline')
+        if cache.offline:
+            # Nada sai para a rede: não há host para poupar
+            throttle = AdaptiveHostLimiter(delay=0, min_delay=0)
+    session = setup_session(cache=cache)
+    fetcher = setup_fetcher(session, limiter=throttle, cache=cache)
+    if METRICS_JSONL:
+        metrics.configure(os.path.join(output_dir, METRICS_JSONL))
+
+    # Vários links separados por espaço são baixados em paralelo, um por série
+    start_urls = input("Digite o link do primeiro capítulo: ").split()
+
+    with profiling(PROFILE_OUTPUT and os.path.join(output_dir, PROFILE_OUTPUT)):
+        run_pipeline(start_urls, num_chapters, output_dir, fetcher, session, transcoder, throttle, image_limiter, blobs)
+
+    transcoder.shutdown()
+    fetcher.close()
+    session.close()
+    if cache is not None:
+        cache.close()
+    metrics.close()
+    if METRICS_PROMETHEUS:
+        metrics.write_prometheus(os.path.join(output_dir, METRICS_PROMETHEUS))
+    metrics.print_summary()
     print("\n✅ Processo concluído! Todos os capítulos foram baixados e os leitores HTML gerados.")
 
 if __name__ == "__main__":
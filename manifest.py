@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import threading
+from archive import archive_path
+
+MANIFEST_NAME = "manifest.json"
+
+
+class ChapterManifest:
+    def __init__(self, chapter_dir):
+        self.path = os.path.join(chapter_dir, MANIFEST_NAME)
+        self.archive_path = archive_path(chapter_dir)
+        self.pages_dir = os.path.join(chapter_dir, "pages")
+        self.pages = {}
+        self.missing = []
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.pages = data.get('pages', {})
+            self.missing = data.get('missing', [])
+        except FileNotFoundError:
+            self.pages = {}
+        except (ValueError, OSError) as e:
+            print(f"[AVISO] Manifesto inválido em {self.path}, ignorando: {e}")
+            self.pages = {}
+
+    def get(self, page):
+        with self._lock:
+            entry = self.pages.get(page)
+            return dict(entry) if entry else None
+
+    def items(self):
+        with self._lock:
+            return sorted((page, dict(entry)) for page, entry in self.pages.items())
+
+    def is_complete(self, page, url):
+        entry = self.get(page)
+        if not entry or entry.get('url') != url:
+            return False
+        # Tiras fatiadas: a página vale pelos pedaços, cada um com sua entrada
+        if entry.get('tiles'):
+            return all(self._has_file(self.get(tile)) for tile in entry['tiles'])
+        return self._has_file(entry)
+
+    def _has_file(self, entry):
+        if not entry or not entry.get('file'):
+            return False
+        if entry.get('archived'):
+            return os.path.exists(self.archive_path)
+        return os.path.exists(os.path.join(self.pages_dir, entry['file']))
+
+    def is_stale(self, page, max_age):
+        if max_age is None:
+            return False
+        entry = self.get(page) or {}
+        return time.time() - entry.get('checked_at', 0) > max_age
+
+    def update(self, page, **fields):
+        with self._lock:
+            self.pages.setdefault(page, {}).update(fields)
+            self._save()
+
+    def remove(self, page):
+        with self._lock:
+            if self.pages.pop(page, None) is not None:
+                self._save()
+
+    def set_missing(self, missing):
+        with self._lock:
+            self.missing = list(missing)
+            self._save()
+
+    def _save(self):
+        # Grava em arquivo temporário e renomeia, para que uma interrupção
+        # nunca deixe o manifesto pela metade
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'pages': self.pages, 'missing': self.missing}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
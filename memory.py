@@ -0,0 +1,48 @@
+import threading
+from contextlib import contextmanager
+from PIL import Image
+
+# Memória máxima (em bytes) ocupada ao mesmo tempo por imagens decodificadas,
+# somando conversões, recortes e os processos de recompressão
+MEMORY_BUDGET = 512 * 1024 * 1024
+
+
+def decoded_size(path):
+    # Image.open só lê o cabeçalho: estima o tamanho da imagem decodificada
+    try:
+        with Image.open(path) as img:
+            return img.width * img.height * max(len(img.getbands()), 3)
+    except Exception:
+        return 0
+
+
+class MemoryBudget:
+    def __init__(self, limit=MEMORY_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, amount):
+        # Uma imagem maior que o orçamento inteiro ainda passa, mas sozinha
+        amount = min(amount, self.limit)
+        with self._condition:
+            while self.used and self.used + amount > self.limit:
+                self._condition.wait()
+            self.used += amount
+        return amount
+
+    def release(self, amount):
+        with self._condition:
+            self.used -= amount
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, amount):
+        amount = self.acquire(amount)
+        try:
+            yield
+        finally:
+            self.release(amount)
+
+
+default_budget = MemoryBudget()
@@ -0,0 +1,135 @@
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from html_writer import atomic_writer
+
+
+class Metrics:
+    # Tempo (e bytes) por etapa do pipeline; cada medição também pode ir para
+    # um arquivo JSON-lines com os rótulos (capítulo, página, ...)
+    def __init__(self):
+        self.stages = {}
+        self._events = None
+        self._lock = threading.Lock()
+
+    def configure(self, jsonl_path=None):
+        if jsonl_path:
+            self._events = open(jsonl_path, 'a', encoding='utf-8')
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        # O bloco pode preencher sample['bytes'] e outros rótulos
+        sample = dict(labels)
+        start = time.perf_counter()
+        try:
+            yield sample
+        finally:
+            self.record(stage, time.perf_counter() - start, **sample)
+
+    def record(self, stage, seconds, bytes=0, **labels):
+        with self._lock:
+            data = self.stages.setdefault(stage, {'seconds': [], 'bytes': 0})
+            data['seconds'].append(seconds)
+            data['bytes'] += bytes or 0
+            if self._events is not None:
+                event = {'ts': round(time.time(), 3), 'stage': stage, 'seconds': round(seconds, 6)}
+                if bytes:
+                    event['bytes'] = bytes
+                event.update(labels)
+                self._events.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def summary(self):
+        rows = []
+        with self._lock:
+            for stage, data in self.stages.items():
+                seconds = sorted(data['seconds'])
+                total = sum(seconds)
+                rows.append({
+                    'stage': stage,
+                    'count': len(seconds),
+                    'total': total,
+                    'mean': total / len(seconds),
+                    'p50': seconds[len(seconds) // 2],
+                    'p95': seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))],
+                    'max': seconds[-1],
+                    'bytes': data['bytes']
+                })
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def print_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        print(f"\n{'etapa':<14}{'qtd':>7}{'total s':>10}{'média ms':>10}{'p95 ms':>10}{'máx ms':>10}{'MB':>9}{'MB/s':>8}")
+        for row in rows:
+            mb = row['bytes'] / 1024 / 1024
+            rate = f"{mb / row['total']:.1f}" if row['bytes'] and row['total'] else ""
+            print(f"{row['stage']:<14}{row['count']:>7}{row['total']:>10.2f}{row['mean'] * 1000:>10.1f}"
+                  f"{row['p95'] * 1000:>10.1f}{row['max'] * 1000:>10.1f}{(f'{mb:.1f}' if row['bytes'] else ''):>9}{rate:>8}")
+
+    def write_prometheus(self, path):
+        lines = [
+            "# HELP manga_stage_seconds Tempo gasto por etapa do pipeline.",
+            "# TYPE manga_stage_seconds summary"
+        ]
+        rows = self.summary()
+        for row in rows:
+            label = f'stage="{row["stage"]}"'
+            lines.append(f'manga_stage_seconds{{{label},quantile="0.5"}} {row["p50"]:.6f}')
+            lines.append(f'manga_stage_seconds{{{label},quantile="0.95"}} {row["p95"]:.6f}')
+            lines.append(f'manga_stage_seconds_sum{{{label}}} {row["total"]:.6f}')
+            lines.append(f'manga_stage_seconds_count{{{label}}} {row["count"]}')
+        lines.append("# HELP manga_stage_bytes_total Bytes processados por etapa.")
+        lines.append("# TYPE manga_stage_bytes_total counter")
+        for row in rows:
+            if row['bytes']:
+                lines.append(f'manga_stage_bytes_total{{stage="{row["stage"]}"}} {row["bytes"]}')
+        with atomic_writer(path) as f:
+            f.write("\n".join(lines) + "\n")
+
+    def close(self):
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def profiling(path, top=25):
+    # cProfile na thread principal e em toda thread criada enquanto ativo
+    # (downloads, produtores); as estatísticas são somadas no final
+    if not path:
+        yield
+        return
+    profiles = [cProfile.Profile()]
+
+    def start_thread_profile(frame, event, arg):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+: o perfil da thread principal já cobre todas as threads
+            return
+        profiles.append(profile)
+
+    profiles[0].enable()
+    threading.setprofile(start_thread_profile)
+    try:
+        yield
+    finally:
+        threading.setprofile(None)
+        profiles[0].disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            profile.disable()
+            stats.add(profile)
+        stats.dump_stats(path)
+        print(f"\n[INFO] Perfil gravado em {path}")
+        stats.sort_stats('cumulative').print_stats(top)
@@ -0,0 +1,69 @@
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Intervalo inicial entre navegações para o mesmo host, em segundos
+HOST_DELAY = 2
+MIN_DELAY = 0.5
+MAX_DELAY = 60
+# Fator aplicado ao intervalo a cada resposta bem-sucedida
+SPEEDUP = 0.9
+# Menor intervalo usado depois de um 429/5xx, mesmo partindo de zero
+BACKOFF_STEP = 1
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveHostLimiter:
+    def __init__(self, delay=HOST_DELAY, min_delay=MIN_DELAY, max_delay=MAX_DELAY):
+        self.initial_delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._delays = {}
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+
+    def delay(self, url):
+        with self._lock:
+            return self._delays.get(urlparse(url).netloc, self.initial_delay)
+
+    def reserve(self, url):
+        # Marca a vez desta requisição e devolve quanto falta esperar por ela;
+        # o modo assíncrono espera com asyncio.sleep em vez de time.sleep
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            ready_at = max(now, self._next_allowed.get(host, now))
+            self._next_allowed[host] = ready_at + self._delays.get(host, self.initial_delay)
+        return ready_at - now
+
+    def wait(self, url):
+        pause = self.reserve(url)
+        if pause > 0:
+            time.sleep(pause)
+
+    def observe(self, url, status_code, retry_after=None):
+        # Acelera a cada sucesso e recua quando o servidor reclama (429/5xx)
+        host = urlparse(url).netloc
+        with self._lock:
+            delay = self._delays.get(host, self.initial_delay)
+            if status_code == 429 or status_code >= 500:
+                delay = min(max(delay * 2, BACKOFF_STEP), self.max_delay)
+                if retry_after:
+                    pause_until = time.monotonic() + retry_after
+                    self._next_allowed[host] = max(self._next_allowed.get(host, 0), pause_until)
+            elif status_code < 400:
+                delay = max(delay * SPEEDUP, self.min_delay)
+            self._delays[host] = delay
@@ -0,0 +1,43 @@
+import time
+import random
+import requests
+from ratelimit import parse_retry_after
+
+RETRY_ATTEMPTS = 4
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
+# (conexão, leitura) em segundos, repassado ao requests
+TIMEOUT = (10, 30)
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class RetryPolicy:
+    def __init__(self, attempts=RETRY_ATTEMPTS, base=BACKOFF_BASE, max_delay=BACKOFF_MAX):
+        self.attempts = attempts
+        self.base = base
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Backoff exponencial com jitter completo
+        return random.uniform(0, min(self.max_delay, self.base * 2 ** attempt))
+
+    def call(self, func, *args, description="requisição"):
+        for attempt in range(self.attempts):
+            try:
+                return func(*args)
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code not in RETRY_STATUS:
+                    raise
+                error = e
+                retry_after = parse_retry_after(e.response.headers.get('Retry-After'))
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+                retry_after = None
+
+            if attempt == self.attempts - 1:
+                raise error
+            delay = self.backoff(attempt, retry_after)
+            print(f"[AVISO] {description} falhou ({error}); tentativa {attempt + 2}/{self.attempts} em {delay:.1f}s")
+            time.sleep(delay)
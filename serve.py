@@ -0,0 +1,107 @@
+import os
+import argparse
+import mimetypes
+import threading
+from functools import partial
+from urllib.parse import unquote, urlparse
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from archive import ArchiveReader, archive_path
+
+_readers = {}
+# Requisições usando cada leitor; um leitor substituído só é fechado quando
+# a última delas termina (o mmap não pode fechar com fatias em uso)
+_users = {}
+_retired = set()
+_readers_lock = threading.Lock()
+
+
+def get_reader(path):
+    # Um mmap por CBZ, reaberto só quando o arquivo muda no disco;
+    # quem recebe um leitor deve devolvê-lo com release_reader
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _readers_lock:
+        reader = _readers.get(path)
+        if reader is None or reader.mtime != mtime:
+            if reader is not None:
+                _retire(reader)
+            reader = _readers[path] = ArchiveReader(path)
+        _users[reader] = _users.get(reader, 0) + 1
+        return reader
+
+
+def release_reader(reader):
+    with _readers_lock:
+        _users[reader] -= 1
+        if reader in _retired and not _users[reader]:
+            _close(reader)
+
+
+def _retire(reader):
+    _retired.add(reader)
+    if not _users.get(reader):
+        _close(reader)
+
+
+def _close(reader):
+    _retired.discard(reader)
+    _users.pop(reader, None)
+    reader.close()
+
+
+class LibraryHandler(SimpleHTTPRequestHandler):
+    # Serve a biblioteca como arquivos comuns; páginas que não existem soltas
+    # em <capitulo>/pages/ são lidas direto do pages.cbz do capítulo
+    def do_GET(self):
+        reader, name = self._archive_entry()
+        if reader is None:
+            return super().do_GET()
+        try:
+            data = reader.get(name)
+            if data is None:
+                return super().do_GET()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", mimetypes.guess_type(self.path)[0] or "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Cache-Control", "max-age=86400")
+                self.end_headers()
+                self.wfile.write(data)
+            finally:
+                data.release()
+        finally:
+            release_reader(reader)
+
+    def _archive_entry(self):
+        parts = unquote(urlparse(self.path).path).strip('/').split('/')
+        if len(parts) < 3 or parts[1] != "pages" or '..' in parts:
+            return None, None
+        chapter_dir = os.path.join(self.directory, parts[0])
+        if os.path.exists(os.path.join(chapter_dir, *parts[1:])):
+            return None, None
+        return get_reader(archive_path(chapter_dir)), '/'.join(parts[2:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local da biblioteca (lê páginas dos CBZ)")
+    parser.add_argument("library", help="pasta com os capítulos e o index.html")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--bind", default="127.0.0.1")
+    args = parser.parse_args()
+
+    handler = partial(LibraryHandler, directory=os.path.abspath(args.library))
+    server = ThreadingHTTPServer((args.bind, args.port), handler)
+    print(f"Biblioteca disponível em http://{args.bind}:{args.port}/index.html")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import threading
+import requests
+from urllib.parse import urljoin, urlparse
+from retry import TIMEOUT
+from metrics import metrics
+
+# Como escolher entre as variantes do srcset de cada página:
+# 'largest' - a maior (comportamento original)
+# 'width'   - a menor com pelo menos TARGET_WIDTH pixels (ou TARGET_DENSITY)
+# 'budget'  - a maior cujo Content-Length cabe na parte de cada página em CHAPTER_BYTE_BUDGET
+# 'probe'   - a maior cujo Content-Length não passa de MAX_VARIANT_BYTES
+VARIANT_POLICY = 'largest'
+TARGET_WIDTH = 1080
+# Usada pela política 'width' quando o srcset só tem descritores de densidade (2x)
+TARGET_DENSITY = 1
+CHAPTER_BYTE_BUDGET = 40 * 1024 * 1024
+MAX_VARIANT_BYTES = 1024 * 1024
+
+
+def _parse_descriptors(tokens):
+    # Devolve (largura, densidade) ou None se os descritores forem inválidos
+    width = density = None
+    for token in tokens:
+        value, unit = token[:-1], token[-1:].lower()
+        try:
+            if unit == 'w' and width is None:
+                width = int(value)
+            elif unit == 'x' and density is None:
+                density = float(value)
+            elif unit == 'h':
+                continue
+            else:
+                return None
+        except ValueError:
+            return None
+    if width is not None and density is not None:
+        return None
+    if width is None and density is None:
+        density = 1.0
+    return width, density
+
+
+def parse_srcset(srcset, base_url=None):
+    # Segue o algoritmo do HTML: a URL vai até o primeiro espaço (e pode conter
+    # vírgulas); os descritores vão até a próxima vírgula fora de parênteses.
+    # Devolve [(url, largura, densidade)], com largura ou densidade em None
+    candidates = []
+    position, length = 0, len(srcset or '')
+    while position < length:
+        while position < length and (srcset[position].isspace() or srcset[position] == ','):
+            position += 1
+        start = position
+        while position < length and not srcset[position].isspace():
+            position += 1
+        url = srcset[start:position]
+        if not url:
+            break
+        tokens = []
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            start, depth = position, 0
+            while position < length:
+                char = srcset[position]
+                if char == '(':
+                    depth += 1
+                elif char == ')':
+                    depth = max(0, depth - 1)
+                elif char == ',' and depth == 0:
+                    break
+                position += 1
+            tokens = srcset[start:position].split()
+            position += 1
+        descriptor = _parse_descriptors(tokens)
+        if url and descriptor is not None:
+            candidates.append((urljoin(base_url, url) if base_url else url, *descriptor))
+    return candidates
+
+
+def image_candidates(img, base_url):
+    candidates = parse_srcset(img.get('srcset') or img.get('data-srcset'), base_url)
+    src = img.get('src') or img.get('data-src')
+    # Como no navegador: o src vale como 1x quando o srcset não tem larguras nem um 1x
+    if src and not any(width is not None or density == 1 for _, width, density in candidates):
+        candidates.append((urljoin(base_url, src), None, 1.0))
+    return candidates
+
+
+def candidate_rank(candidate):
+    # Larguras vencem densidades quando o site mistura os dois (o que o HTML não permite)
+    _, width, density = candidate
+    return (width is not None, width or 0, density or 0)
+
+
+def describe(candidate):
+    _, width, density = candidate
+    return f"{width}w" if width is not None else f"{density:g}x"
+
+
+class VariantSelector:
+    def __init__(self, policy=VARIANT_POLICY, target_width=TARGET_WIDTH, chapter_budget=CHAPTER_BYTE_BUDGET, max_bytes=MAX_VARIANT_BYTES):
+        self.policy = policy
+        self.target_width = target_width
+        self.chapter_budget = chapter_budget
+        self.max_bytes = max_bytes
+        # (host, limite de bytes) -> (largura, densidade) escolhida na sondagem;
+        # as páginas seguintes do mesmo CDN reaproveitam a escolha sem novos HEAD
+        self._choices = {}
+        self._lock = threading.Lock()
+
+    def choose(self, pages, session=None, referer=None):
+        # pages: uma lista de candidatos por imagem; devolve uma URL por imagem.
+        # referer é a página do capítulo, enviada nas sondagens como no download
+        # (CDNs com proteção contra hotlink recusam o HEAD sem ele)
+        headers = {'Referer': referer} if referer else None
+        limit = None
+        if self.policy == 'budget':
+            limit = self.chapter_budget // max(1, len(pages))
+        elif self.policy == 'probe':
+            limit = self.max_bytes
+        return [self._choose_page(candidates, limit, session, headers)[0] for candidates in pages]
+
+    def _choose_page(self, candidates, limit, session, headers=None):
+        candidates = sorted(candidates, key=candidate_rank)
+        if len(candidates) == 1 or self.policy == 'largest':
+            return candidates[-1]
+        if limit is None or session is None:
+            return self._by_width(candidates)
+
+        key = (urlparse(candidates[-1][0]).netloc, limit)
+        with self._lock:
+            choice = self._choices.get(key)
+        if choice is None:
+            choice = self._probe(candidates, limit, session, headers)
+            if choice is None:
+                # Sem Content-Length não há como medir: cai para a largura alvo
+                return self._by_width(candidates)
+            with self._lock:
+                self._choices[key] = choice
+        return self._matching(candidates, choice)
+
+    def _by_width(self, candidates):
+        for candidate in candidates:
+            _, width, density = candidate
+            if (width or 0) >= self.target_width or (width is None and density >= TARGET_DENSITY):
+                return candidate
+        return candidates[-1]
+
+    def _matching(self, candidates, choice):
+        # A mesma variante escolhida na sondagem ou, se a página não a tiver,
+        # a maior que não passa dela
+        chosen = ('', *choice)
+        below = [candidate for candidate in candidates if candidate_rank(candidate) <= candidate_rank(chosen)]
+        return below[-1] if below else candidates[0]
+
+    def _probe(self, candidates, limit, session, headers=None):
+        sizes = False
+        for candidate in reversed(candidates):
+            size = probe_size(candidate[0], session, headers)
+            if size is None:
+                continue
+            sizes = True
+            if size <= limit:
+                print(f"[INFO] Variante {describe(candidate)} escolhida para {urlparse(candidate[0]).netloc} "
+                      f"({size / 1024:.0f} KB, limite {limit / 1024:.0f} KB)")
+                return candidate[1:]
+        if sizes:
+            # Nenhuma cabe no limite: fica com a menor
+            return candidates[0][1:]
+        return None
+
+
+def probe_size(url, session, headers=None):
+    try:
+        with metrics.timer('probe'):
+            response = session.head(url, headers=headers, timeout=TIMEOUT, allow_redirects=True)
+            if response.status_code in (405, 501):
+                # Servidor sem HEAD: só os cabeçalhos de um GET, sem ler o corpo
+                with session.get(url, headers=headers, timeout=TIMEOUT, stream=True) as response:
+                    pass
+        length = response.headers.get('Content-Length')
+        if response.ok and length:
+            return int(length)
+    except (requests.RequestException, ValueError) as e:
+        print(f"[AVISO] Não foi possível medir {url}: {e}")
+    return None
+
+
+default_selector = VariantSelector()
@@ -0,0 +1,152 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from httpcache import HttpCache, CachingAdapter, CacheMiss
+
+BODY = b"corpo da pagina"
+ETAG = '"v1"'
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    # /fresh vale um minuto; /stale vence na hora e só responde 304 ao ETag certo
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path == '/stale' and self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.send_header('Cache-Control', 'max-age=0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.send_header('ETag', ETAG)
+        self.send_header('Cache-Control', 'max-age=60' if self.path == '/fresh' else 'max-age=0')
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+class CachingAdapterTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), OriginHandler)
+        cls.server.daemon_threads = True
+        cls.server.requests = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self.root = tempfile.mkdtemp()
+        self.caches = []
+        self.session = self.open_session()
+
+    def tearDown(self):
+        self.session.close()
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def open_session(self, offline=False):
+        cache = HttpCache(self.root, offline=offline)
+        self.caches.append(cache)
+        session = requests.Session()
+        session.mount('http://', CachingAdapter(cache))
+        return session
+
+    def get(self, path, session=None, **kwargs):
+        response = (session or self.session).get(self.base_url + path, **kwargs)
+        # O corpo precisa ser lido até o fim para a cópia entrar no cache
+        response.content
+        return response
+
+    def test_fresh_response_comes_from_cache(self):
+        self.get('/fresh')
+        response = self.get('/fresh')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, BODY)
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stale_revalidation_returns_the_cached_body(self):
+        self.get('/stale')
+        response = self.get('/stale')
+        # O servidor recebeu o validador da cópia e respondeu 304...
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1][1].get('If-None-Match'), ETAG)
+        # ...mas quem pediu um GET simples recebe a página inteira
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, BODY)
+        self.assertNotIn('If-None-Match', response.request.headers)
+
+    def test_own_conditions_pass_the_304_through(self):
+        self.get('/stale')
+        response = self.get('/stale', headers={'If-None-Match': ETAG})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_fresh_entry_answers_own_conditions_with_304(self):
+        self.get('/fresh')
+        response = self.get('/fresh', headers={'If-None-Match': ETAG})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stored_headers_are_case_insensitive(self):
+        self.get('/stale')
+        entry = self.caches[0].lookup(self.base_url + '/stale')
+        self.assertEqual(entry['headers']['etag'], ETAG)
+        entry = self.caches[0].refresh(entry, {'etag': '"v2"'})
+        self.assertEqual(entry['headers']['ETag'], '"v2"')
+        self.assertEqual(self.caches[0].lookup(self.base_url + '/stale')['headers']['ETAG'], '"v2"')
+
+    def test_offline_serves_copies_and_raises_on_miss(self):
+        self.get('/stale')
+        offline = self.open_session(offline=True)
+        try:
+            response = self.get('/stale', session=offline)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, BODY)
+            self.assertEqual(len(self.server.requests), 1)
+            with self.assertRaises(CacheMiss):
+                self.get('/fresh', session=offline)
+        finally:
+            offline.close()
+
+
+class HttpCacheSizeTest(unittest.TestCase):
+    def test_limit_counts_entries_from_other_processes(self):
+        # Duas instâncias no mesmo diretório fazem o papel de dois workers do batch
+        root = tempfile.mkdtemp()
+        first = HttpCache(root, max_bytes=10000)
+        second = HttpCache(root, max_bytes=10000)
+        try:
+            for i in range(4):
+                first.store_bytes(f"http://a/{i}", {}, b'x' * 2000, 60)
+                second.store_bytes(f"http://b/{i}", {}, b'x' * 2000, 60)
+            total = first._conn.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+            self.assertLessEqual(total, 10000)
+            self.assertIsNone(first.lookup("http://a/0"))
+        finally:
+            first.close()
+            second.close()
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
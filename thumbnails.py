@@ -0,0 +1,57 @@
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from archive import open_page
+
+THUMB_DIR = ".thumbs"
+# Os cards têm ~180px de largura; 360px cobre telas de alta densidade
+THUMB_WIDTH = 360
+THUMB_FORMAT = 'WEBP'
+THUMB_QUALITY = 75
+
+
+def make_thumbnail(src_path, thumbs_dir, width=THUMB_WIDTH):
+    # Executa em outro processo; o nome da miniatura vem do conteúdo da capa,
+    # então capas iguais (ou inalteradas) reaproveitam o mesmo arquivo
+    hasher = hashlib.sha1()
+    with open_page(src_path) as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    name = f"{hasher.hexdigest()}_{width}.{THUMB_FORMAT.lower()}"
+    dst_path = os.path.join(thumbs_dir, name)
+
+    if os.path.exists(dst_path):
+        with Image.open(dst_path) as thumb:
+            return name, thumb.size
+
+    with open_page(src_path) as f, Image.open(f) as img:
+        # Em JPEG, draft decodifica já em escala reduzida
+        img.draft('RGB', (width, width * 4))
+        img.thumbnail((width, width * 4))
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        img.save(dst_path + '.part', format=THUMB_FORMAT, quality=THUMB_QUALITY)
+        size = img.size
+    os.replace(dst_path + '.part', dst_path)
+    return name, size
+
+
+def generate_thumbnails(base_dir, covers, width=THUMB_WIDTH, workers=None):
+    # covers: {chave: caminho relativo da capa}; devolve {chave: (miniatura, largura, altura)}
+    thumbs_dir = os.path.join(base_dir, THUMB_DIR)
+    os.makedirs(thumbs_dir, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {
+            key: executor.submit(make_thumbnail, os.path.join(base_dir, cover), thumbs_dir, width)
+            for key, cover in covers.items()
+        }
+        for key, future in futures.items():
+            try:
+                name, (thumb_width, thumb_height) = future.result()
+            except Exception as e:
+                print(f"Falha ao gerar miniatura de {covers[key]}: {e}")
+                continue
+            results[key] = (os.path.join(THUMB_DIR, name), thumb_width, thumb_height)
+    return results
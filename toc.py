@@ -0,0 +1,108 @@
+import re
+from urllib.parse import urljoin, urlparse, unquote
+
+# Número do capítulo no texto do link ou na URL ("Capítulo 12", "chapter-10.5", "cap_7")
+CHAPTER_PATTERN = re.compile(
+    r'(?:cap[íi]tulo|chapter|chap|cap|ch|ep[ií]s[óo]dio|episode|ep)[\s._#-]*(\d+(?:[.,]\d+)?)', re.IGNORECASE
+)
+# Abaixo disso a lista encontrada provavelmente não é a lista de capítulos
+MIN_TOC_CHAPTERS = 2
+
+
+def normalize_number(value):
+    number = float(value.replace(',', '.'))
+    return int(number) if number.is_integer() else number
+
+
+def chapter_number(text, url):
+    match = CHAPTER_PATTERN.search(text or '') or CHAPTER_PATTERN.search(unquote(urlparse(url).path))
+    if match:
+        return normalize_number(match.group(1))
+    # Último recurso: o último número do último trecho da URL ("/obra/12/")
+    segment = urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+    numbers = re.findall(r'\d+(?:\.\d+)?', segment)
+    return normalize_number(numbers[-1]) if numbers else None
+
+
+def same_chapter(url, other):
+    return url.split('#')[0].rstrip('/') == other.split('#')[0].rstrip('/')
+
+
+def url_shape(url):
+    # "/manga/obra/capitulo-12/" -> ("/manga/obra/", "capitulo-#"): capítulos da
+    # mesma série dividem a pasta e o formato do último trecho
+    path = urlparse(url).path.rstrip('/')
+    prefix, _, segment = path.rpartition('/')
+    return prefix + '/', re.sub(r'\d+(?:[.-]\d+)*', '#', segment)
+
+
+def series_url(chapter_url):
+    prefix, _ = url_shape(chapter_url)
+    if prefix.strip('/') == '':
+        return None
+    return urljoin(chapter_url, prefix)
+
+
+def parse_chapter_list(soup, chapter_url, links=True):
+    host = urlparse(chapter_url).netloc
+    prefix, shape = url_shape(chapter_url)
+    candidates = []
+
+    # Seletor de capítulos (<select>) comum nas páginas de leitura
+    for select in soup.find_all('select'):
+        entries = []
+        for option in select.find_all('option'):
+            value = option.get('data-url') or option.get('value') or ''
+            if not value or value.startswith('#'):
+                continue
+            url = urljoin(chapter_url, value)
+            if urlparse(url).netloc != host:
+                continue
+            number = chapter_number(option.get_text(" ", strip=True), url)
+            if number is not None:
+                entries.append((number, url))
+        candidates.append(entries)
+
+    # Links com a mesma pasta e o mesmo formato da URL do capítulo
+    entries = []
+    anchors = soup.find_all('a', href=True) if links else []
+    for a in anchors:
+        url = urljoin(chapter_url, a['href']).split('#')[0]
+        if urlparse(url).netloc != host or url_shape(url) != (prefix, shape):
+            continue
+        number = chapter_number(a.get_text(" ", strip=True), url)
+        if number is not None:
+            entries.append((number, url))
+    candidates.append(entries)
+
+    best = []
+    for entries in candidates:
+        # Um link por número: listas costumam repetir o capítulo (capa, título, botão)
+        chapters = {}
+        for number, url in entries:
+            chapters.setdefault(number, url)
+        if len(chapters) > len(best):
+            best = sorted(chapters.items())
+    return best if len(best) >= MIN_TOC_CHAPTERS else []
+
+
+def discover_chapters(page, fetcher, throttle=None):
+    # Procura o sumário no seletor da própria página do capítulo (os links dela
+    # são só anterior/próximo) e, se não houver, na página da série; devolve
+    # [(número, url)] em ordem ou [] para seguir os links
+    chapters = parse_chapter_list(page.soup, page.url, links=False)
+    if chapters:
+        return chapters
+    url = series_url(page.url)
+    if url is None or same_chapter(url, page.url):
+        return []
+    try:
+        if throttle is not None:
+            throttle.wait(url)
+        # A página da série não tem imagens de capítulo: com o AutoPageFetcher
+        # ela iria sempre para o Chrome, então vai direto pelo HTTP
+        fetcher = getattr(fetcher, 'http_fetcher', fetcher)
+        return parse_chapter_list(fetcher.fetch(url).soup, page.url)
+    except Exception as e:
+        print(f"[AVISO] Não foi possível ler a página da série {url}: {e}")
+        return []
@@ -0,0 +1,268 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+from memory import default_budget, decoded_size
+from metrics import metrics
+
+# Plugins opcionais: registram AVIF (Pillow antigo) e JPEG-XL quando instalados
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+try:
+    import pillow_jxl  # noqa: F401
+except ImportError:
+    pass
+
+TRANSCODE_QUALITY = 80
+# Largura máxima das páginas recomprimidas; None mantém o tamanho original
+TRANSCODE_MAX_WIDTH = None
+TRANSCODE_EXTENSIONS = {'WEBP': '.webp', 'AVIF': '.avif', 'JPEG': '.jpg', 'JXL': '.jxl'}
+# Nomes comuns que o Pillow não reconhece como formato
+FORMAT_ALIASES = {'JPG': 'JPEG', 'JPEG-XL': 'JXL'}
+# Larguras das cópias reduzidas usadas no srcset do leitor (celulares), por
+# exemplo (720,); vazio não gera variantes (cada uma decodifica a página de novo)
+VARIANT_WIDTHS = ()
+VARIANT_DIR = "variants"
+VARIANT_FORMAT = 'WEBP'
+VARIANT_QUALITY = 75
+# Altura máxima dos pedaços de tiras longas (webtoons) quando elas são fatiadas
+TILE_HEIGHT = 2000
+TILE_QUALITY = 95
+
+
+def transcode_page(src_path, fmt, quality=TRANSCODE_QUALITY, max_width=None, page_path=None):
+    # Executa em outro processo: recebe e devolve apenas tipos simples.
+    # src_path é a imagem decodificada (o original guardado, se a página já
+    # foi recomprimida); o resultado substitui page_path
+    start = time.process_time()
+    page_path = page_path or src_path
+    bytes_in = os.path.getsize(src_path)
+    dst_path = os.path.splitext(page_path)[0] + TRANSCODE_EXTENSIONS[fmt]
+
+    with Image.open(src_path) as img:
+        if max_width and img.width > max_width:
+            height = round(img.height * max_width / img.width)
+            # Em JPEG, draft decodifica já em escala reduzida
+            img.draft('RGB', (max_width, height))
+            img = img.resize((max_width, height), Image.LANCZOS)
+        if img.mode == 'P':
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.save(dst_path + '.part', format=fmt, quality=quality)
+        width, height = img.size
+
+    os.replace(dst_path + '.part', dst_path)
+    if dst_path != page_path:
+        os.remove(page_path)
+    return {
+        'file': os.path.basename(dst_path),
+        'width': width,
+        'height': height,
+        'bytes_in': bytes_in,
+        'bytes_out': os.path.getsize(dst_path),
+        'cpu_time': time.process_time() - start
+    }
+
+
+def slice_strip(src_path, tile_height=TILE_HEIGHT, quality=TILE_QUALITY):
+    # Divide uma imagem alta em pedaços de altura parecida (sem um último
+    # pedaço minúsculo) no mesmo formato; devolve [(arquivo, largura, altura)]
+    stem, extension = os.path.splitext(src_path)
+    tiles = []
+    with Image.open(src_path) as img:
+        fmt = img.format
+        count = -(-img.height // tile_height)
+        step = -(-img.height // count)
+        img.load()
+        for index, top in enumerate(range(0, img.height, step), 1):
+            tile = img.crop((0, top, img.width, min(top + step, img.height)))
+            dst_path = f"{stem}_t{index:02d}{extension}"
+            tile.save(dst_path + '.part', format=fmt, quality=quality)
+            os.replace(dst_path + '.part', dst_path)
+            tiles.append((os.path.basename(dst_path), tile.width, tile.height))
+    os.remove(src_path)
+    return tiles
+
+
+def make_variants(src_path, widths, fmt=VARIANT_FORMAT, quality=VARIANT_QUALITY):
+    # Executa em outro processo; só gera larguras menores que a original.
+    # Devolve as variantes e o tempo de CPU gasto
+    start = time.process_time()
+    pages_dir, name = os.path.split(src_path)
+    stem = os.path.splitext(name)[0]
+    variants_dir = os.path.join(pages_dir, VARIANT_DIR)
+    os.makedirs(variants_dir, exist_ok=True)
+
+    variants = []
+    with Image.open(src_path) as img:
+        widths = sorted((w for w in widths if w < img.width), reverse=True)
+        if not widths:
+            return variants, time.process_time() - start
+        img.draft('RGB', (widths[0], round(img.height * widths[0] / img.width)))
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        for width in widths:
+            height = round(img.height * width / img.width)
+            filename = f"{stem}.{width}w{TRANSCODE_EXTENSIONS[fmt]}"
+            dst_path = os.path.join(variants_dir, filename)
+            img.resize((width, height), Image.LANCZOS).save(dst_path + '.part', format=fmt, quality=quality)
+            os.replace(dst_path + '.part', dst_path)
+            variants.append({'file': os.path.join(VARIANT_DIR, filename), 'width': width, 'height': height})
+    return variants, time.process_time() - start
+
+
+class PageTranscoder:
+    def __init__(self, fmt=None, quality=TRANSCODE_QUALITY, max_width=TRANSCODE_MAX_WIDTH,
+                 variant_widths=VARIANT_WIDTHS, workers=None, blobs=None, budget=None):
+        # fmt=None mantém as páginas originais e só gera as variantes
+        self.format = fmt.upper() if fmt else None
+        self.format = FORMAT_ALIASES.get(self.format, self.format)
+        if self.format and self.format not in TRANSCODE_EXTENSIONS:
+            raise ValueError(f"Formato não suportado: {fmt}")
+        self.settings = {'format': self.format, 'quality': quality, 'max_width': max_width}
+        self.variant_widths = sorted(variant_widths)
+        self.blobs = blobs
+        self.budget = budget if budget is not None else default_budget
+        self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+    def transcode_chapter(self, manifest):
+        results = self._transcode_pages(manifest) if self.format else []
+        if self.variant_widths:
+            self._make_variants(manifest)
+        return results
+
+    def _transcode_key(self, blob):
+        # Mesma origem e mesmas configurações geram sempre o mesmo arquivo
+        stem = os.path.splitext(blob)[0]
+        settings = self.settings
+        return f"{stem}.{settings['format'].lower()}-q{settings['quality']}-w{settings['max_width']}{TRANSCODE_EXTENSIONS[self.format]}"
+
+    def _reuse_transcode(self, manifest, page, entry, key, source):
+        page_path = os.path.join(manifest.pages_dir, entry['file'])
+        filename = os.path.splitext(entry['file'])[0] + TRANSCODE_EXTENSIONS[self.format]
+        dst_path = os.path.join(manifest.pages_dir, filename)
+        bytes_in = os.path.getsize(self.blobs.path(source))
+        self.blobs.link(key, dst_path)
+        if dst_path != page_path:
+            os.remove(page_path)
+        with Image.open(dst_path) as img:
+            width, height = img.size
+        result = {'file': filename, 'width': width, 'height': height, 'bytes_in': bytes_in,
+                  'bytes_out': os.path.getsize(dst_path), 'cpu_time': 0.0}
+        self._record(manifest, page, result, key, source, reused=True)
+        return result
+
+    def _source(self, manifest, page, entry):
+        # Devolve (blob do original, caminho a decodificar). Uma página já
+        # recomprimida só é convertida de novo a partir do original guardado:
+        # recomprimir a saída com perdas anterior acumularia artefatos
+        page_path = os.path.join(manifest.pages_dir, entry['file'])
+        if not entry.get('transcode'):
+            return entry.get('blob'), page_path
+        source = entry.get('source')
+        if self.blobs is not None and source and self.blobs.has(source):
+            return source, self.blobs.path(source)
+        print(f"[AVISO] {page} já foi recomprimida em {entry['transcode']['settings']['format']} e o original "
+              f"não está guardado; apague o manifesto do capítulo para baixar de novo e converter")
+        return None, None
+
+    def _submit(self, func, src_path, *args):
+        # Reserva a memória da imagem decodificada antes de mandar para um
+        # processo; a reserva é devolvida quando ele termina
+        amount = self.budget.acquire(decoded_size(src_path))
+        future = self.executor.submit(func, src_path, *args)
+        future.add_done_callback(lambda _: self.budget.release(amount))
+        return future
+
+    def _record(self, manifest, page, result, blob, source, reused=False):
+        # Tempo de CPU medido dentro do processo que converteu a página
+        metrics.record('transcode', result['cpu_time'], bytes=result['bytes_in'], page=page, reused=reused)
+        # O manifesto guarda o relatório por página junto com a origem; o
+        # blob do original (source) fica para uma conversão futura
+        manifest.update(page, file=result['file'], width=result['width'], height=result['height'],
+                        blob=blob, source=source, transcode={
+            'settings': self.settings,
+            'bytes_saved': result['bytes_in'] - result['bytes_out'],
+            'cpu_time': round(result['cpu_time'], 4)
+        })
+
+    def _transcode_pages(self, manifest):
+        futures = {}
+        results = []
+        replaced = []
+        reused = 0
+        for page, entry in manifest.items():
+            if not entry.get('file') or (entry.get('transcode') or {}).get('settings') == self.settings:
+                continue
+            page_path = os.path.join(manifest.pages_dir, entry['file'])
+            if not os.path.exists(page_path):
+                continue
+            source, src_path = self._source(manifest, page, entry)
+            if src_path is None:
+                continue
+            # A saída de uma conversão anterior sai; o original continua guardado
+            previous = entry.get('blob') if entry.get('transcode') else None
+            # Imagens repetidas (créditos, banners) já convertidas em outro capítulo
+            key = self._transcode_key(source) if self.blobs is not None and source else None
+            if key is not None and self.blobs.has(key):
+                results.append(self._reuse_transcode(manifest, page, entry, key, source))
+                replaced.append(previous)
+                reused += 1
+                continue
+            future = self._submit(
+                transcode_page, src_path, self.format, self.settings['quality'], self.settings['max_width'], page_path
+            )
+            futures[future] = (page, key, source, previous)
+
+        if not futures and not results:
+            return []
+
+        for future in as_completed(futures):
+            page, key, source, previous = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[ERRO] Falha ao converter {page}: {e}")
+                continue
+            blob = None
+            if key is not None:
+                blob = self.blobs.add(os.path.join(manifest.pages_dir, result['file']), key)
+            self._record(manifest, page, result, blob, source)
+            results.append(result)
+            replaced.append(previous)
+
+        # Saídas de conversões anteriores só ficam se outra página ainda usar
+        if self.blobs is not None:
+            self.blobs.collect(replaced)
+
+        saved = sum(r['bytes_in'] - r['bytes_out'] for r in results)
+        cpu_time = sum(r['cpu_time'] for r in results)
+        print(f"[CONVERSÃO] {len(results)} páginas em {self.format} ({reused} reaproveitadas): "
+              f"{saved / 1024:.0f} KiB economizados, {cpu_time:.2f}s de CPU")
+        return results
+
+    def _make_variants(self, manifest):
+        futures = {}
+        for page, entry in manifest.items():
+            variants = entry.get('variants') or {}
+            if not entry.get('file') or (variants.get('source') == entry['file'] and variants.get('widths') == self.variant_widths):
+                continue
+            src_path = os.path.join(manifest.pages_dir, entry['file'])
+            if os.path.exists(src_path):
+                futures[self._submit(make_variants, src_path, self.variant_widths)] = (page, entry['file'])
+
+        for future in as_completed(futures):
+            page, source = futures[future]
+            try:
+                items, cpu_time = future.result()
+            except Exception as e:
+                print(f"[ERRO] Falha ao gerar variantes de {page}: {e}")
+                continue
+            metrics.record('variants', cpu_time, page=page)
+            manifest.update(page, variants={'source': source, 'widths': self.variant_widths, 'items': items})
+
+    def shutdown(self):
+        self.executor.shutdown()